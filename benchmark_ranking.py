@@ -0,0 +1,49 @@
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from server import cumulative_share_counts, top_k_positions
+
+def sort_based_ranking(df, k):
+    """The previous approach: full sort_values, cumsum and boolean indexing"""
+    sorted_df = df.sort_values('population', ascending=False)
+    cumulative_population = sorted_df['population'].cumsum()
+    total_population = df['population'].sum()
+
+    top_50_percent = sorted_df[cumulative_population <= total_population * 0.5]
+    top_80_percent = sorted_df[cumulative_population <= total_population * 0.8]
+    return sorted_df.head(k), len(top_50_percent), len(top_80_percent)
+
+def partial_ranking(df, k):
+    """argpartition top-K plus a single cumsum pass for the threshold counts"""
+    population = df['population'].to_numpy(dtype=np.float64)
+    top_50_count, top_80_count = cumulative_share_counts(population, [0.5, 0.8])
+    return df.iloc[top_k_positions(population, k)], top_50_count, top_80_count
+
+def benchmark_ranking(zip_count=33000, repeat=50):
+    """Compare full-sort ranking against partial selection for the endpoint K values"""
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame({
+        'zip_code': [f"{i:05d}" for i in range(zip_count)],
+        'population': rng.lognormal(8, 1.5, zip_count).round(),
+    })
+
+    print(f"Ranking {zip_count} zip codes ({repeat} runs each)")
+    for k in [20, 100, 1000]:
+        expected_top, expected_50, expected_80 = sort_based_ranking(df, k)
+        actual_top, actual_50, actual_80 = partial_ranking(df, k)
+
+        # Same counts and same ranked values (ties may swap zip codes)
+        assert (expected_50, expected_80) == (actual_50, actual_80)
+        assert np.array_equal(expected_top['population'].to_numpy(), actual_top['population'].to_numpy())
+
+        sort_time = timeit.timeit(lambda: sort_based_ranking(df, k), number=repeat) / repeat
+        partial_time = timeit.timeit(lambda: partial_ranking(df, k), number=repeat) / repeat
+
+        print(f"top {k:>4}: sort_values {sort_time * 1000:7.2f} ms | "
+              f"argpartition {partial_time * 1000:7.2f} ms | "
+              f"{sort_time / partial_time:5.1f}x faster")
+
+if __name__ == "__main__":
+    benchmark_ranking()
@@ -0,0 +1,81 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from server import (EXCEL_DATASET_PATH, MMAP_DATASET_PATH, PARQUET_DATASET_PATH,
+                    clean_demographic_data, load_mmap_dataset, save_mmap_dataset)
+
+EXCEL_PATH = EXCEL_DATASET_PATH
+PARQUET_PATH = PARQUET_DATASET_PATH
+
+def time_load(label, load, repeat):
+    """Best-of-``repeat`` wall time for one way of loading the dataset"""
+    best = None
+    df = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = load()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{label:<42} {best * 1000:10.1f} ms  ({len(df)} rows)")
+    return df
+
+def is_zero_copy(chunked, series):
+    """Whether ``series`` is a view of the Arrow column's data buffer rather than a copy"""
+    if chunked.num_chunks != 1:
+        return False
+    chunk = chunked.chunk(0)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        chunk = chunk.indices
+        values = series.cat.codes.to_numpy()
+    elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy()
+    else:
+        return False
+
+    buffer = chunk.buffers()[1]
+    address = values.__array_interface__['data'][0]
+    return buffer is not None and buffer.address <= address < buffer.address + buffer.size
+
+def report_zero_copy():
+    """Check column by column which columns of the memory-mapped dataset
+    ``to_pandas(split_blocks=True)`` hands out without copying"""
+    table = pa.ipc.open_file(pa.memory_map(MMAP_DATASET_PATH)).read_all()
+    df = table.to_pandas(split_blocks=True)
+
+    copied = [name for name in table.column_names if not is_zero_copy(table.column(name), df[name])]
+    shared = len(table.column_names) - len(copied)
+    shared_bytes = sum(df[name].to_numpy().nbytes for name in table.column_names
+                       if name not in copied and not isinstance(df[name].dtype, pd.CategoricalDtype))
+    print(f"zero-copy columns: {shared} of {len(table.column_names)} "
+          f"({shared_bytes / 1e6:.1f} MB shared through the page cache)")
+    if copied:
+        print(f"copied columns: {', '.join(copied)}")
+    return copied
+
+def benchmark_startup(repeat=5):
+    """Compare dataset startup time for Excel, parquet and memory-mapped columns"""
+    if not os.path.exists(PARQUET_PATH):
+        print(f"Parquet file not found at: {PARQUET_PATH} (run server.py once to create it)")
+        return False
+
+    if os.path.exists(EXCEL_PATH):
+        time_load("Excel + cleaning", lambda: clean_demographic_data(pd.read_excel(EXCEL_PATH)), 1)
+    else:
+        print(f"Excel file not found at: {EXCEL_PATH}")
+
+    df = time_load("parquet", lambda: pd.read_parquet(PARQUET_PATH), repeat)
+
+    if load_mmap_dataset(PARQUET_PATH) is None:
+        save_mmap_dataset(df, PARQUET_PATH)
+    time_load(f"mmap ({MMAP_DATASET_PATH})", lambda: load_mmap_dataset(PARQUET_PATH), repeat)
+    report_zero_copy()
+
+    return True
+
+if __name__ == "__main__":
+    benchmark_startup()
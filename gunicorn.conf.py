@@ -0,0 +1,40 @@
+import gc
+import multiprocessing
+import os
+
+# Bind to the port Heroku (or any PaaS) assigns
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Load the app (and the demographic dataset) once in the master before forking,
+# so workers share the data pages copy-on-write instead of each loading a copy
+preload_app = True
+
+# Every worker adds its own caches and engine structures on top of the shared
+# dataset, so stay conservative unless WEB_CONCURRENCY says otherwise
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2 * multiprocessing.cpu_count() + 1, 4)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# First-time Excel conversion can take a while on a cold deploy
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+def when_ready(arbiter):
+    # Load the dataset in the master, after the app is imported and before any
+    # worker is forked
+    from server import data_store
+    data_store.ensure_loaded()
+
+def pre_fork(server, worker):
+    # Move every object allocated while loading into the permanent generation so
+    # the garbage collector in the workers doesn't touch (and copy) those pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # One BLAS/OpenMP thread per worker thread; the workers already use every core
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
@@ -1,46 +1,369 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
+from scipy import sparse
+from scipy.spatial import cKDTree
+import joblib
 import json
+import csv
+import io
 import os
+import zlib
 import requests
 from functools import lru_cache
 import hashlib
+import threading
+import time
+import itertools
+import struct
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import python_calamine
+except ImportError:
+    python_calamine = None
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes NumPy arrays and scalars.
+
+    When orjson is installed it is used for encoding, and numeric NumPy arrays
+    are written straight from their buffers instead of via Python lists.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        return DefaultJSONProvider.default(o)
+
+    def dumps_bytes(self, obj):
+        if orjson is not None:
+            option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=self.default, option=option)
+        return super().dumps(obj).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return self.dumps_bytes(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+app.json = NumpyJSONProvider(app)
 CORS(app)
 
 # Global variable to store demographic data
 demographic_df = None
 zip_coordinates_df = None
+target_engine = None
+target_engine_lock = threading.Lock()
+
+# Filter value -> source percent columns for each target-population dimension.
+# Every bucket becomes one column of the target engine's fraction matrix.
+TARGET_BUCKETS = {
+    'age': {
+        'under20': ['age_under_10', 'age_10_to_19'],
+        '20-29': ['age_20s'],
+        '30-39': ['age_30s'],
+        '40-49': ['age_40s'],
+        '50-59': ['age_50s'],
+        '60plus': ['age_60s', 'age_70s', 'age_over_80'],
+    },
+    'ethnicity': {
+        'white': ['race_white'],
+        'black': ['race_black'],
+        'hispanic': ['hispanic'],
+        'native': ['race_native'],
+        'asian': ['race_asian'],
+        'pacific': ['race_pacific'],
+    },
+    'income': {
+        'under50k': ['income_household_under_10k', 'income_household_10k_to_15k',
+                     'income_household_15k_to_20k', 'income_household_20k_to_25k',
+                     'income_household_25k_to_30k', 'income_household_30k_to_35k',
+                     'income_household_35k_to_40k', 'income_household_40k_to_45k',
+                     'income_household_45k_to_50k'],
+        '50k-75k': ['income_household_50k_to_60k', 'income_household_60k_to_75k'],
+        '75k-100k': ['income_household_75k_to_100k'],
+        '100k-150k': ['income_household_100k_to_125k', 'income_household_125k_to_150k'],
+        '150k-200k': ['income_household_150k_to_200k'],
+        'over200k': ['income_household_over_200k'],
+    },
+    'gender': {
+        'male': ['male'],
+        'female': ['female'],
+    },
+}
+
+# Filter value that leaves a dimension unconstrained
+TARGET_PASSTHROUGH = {'age': 'all', 'ethnicity': 'all', 'income': 'all', 'gender': 'both'}
+
+# Finer buckets that filters can select but the materialized rankings leave out
+TARGET_EXTRA_BUCKETS = {
+    'income': {
+        '100k-125k': ['income_household_100k_to_125k'],
+        '125k-150k': ['income_household_125k_to_150k'],
+    },
+}
+
+# Alternate spellings of bucket values sent by the analysis forms
+TARGET_VALUE_ALIASES = {
+    'age': {'under-20': 'under20', '60+': '60plus'},
+    'ethnicity': {'white-caucasian': 'white', 'black-african-american': 'black'},
+    'income': {'under-50k': 'under50k', 'over-200k': 'over200k'},
+}
+
+# Education selections: zips where the column's percent reaches the threshold
+EDUCATION_THRESHOLDS = {
+    'highschool': ('education_highschool', 20),
+    'college': ('education_some_college', 20),
+    'bachelors': ('education_bachelors', 20),
+    'graduate': ('education_graduate', 10),
+}
+
+# Flat range filter keys -> (column, bound, scale applied to the value)
+FILTER_RANGE_KEYS = {
+    'min_age': ('median_age', 'min', 1),
+    'max_age': ('median_age', 'max', 1),
+    'min_income': ('median_income', 'min', 1),
+    'max_income': ('median_income', 'max', 1),
+    'min_population': ('population', 'min', 1),
+    'min_college_pct': ('college_degree_pct', 'min', 0.01),
+}
+
+# Customer concentration ethnicity -> minimum share of the zip's population
+CONCENTRATION_ETHNICITY_THRESHOLDS = {
+    'white': ('white_pct', 0.5),
+    'black': ('black_pct', 0.3),
+    'hispanic': ('hispanic_pct', 0.3),
+    'asian': ('asian_pct', 0.15),
+}
+
+# Columns with a packed-bitset threshold index, and quantile bins per column
+THRESHOLD_INDEX_COLUMNS = sorted(
+    {column for column, _, _ in FILTER_RANGE_KEYS.values()}
+    | {column for column, _ in EDUCATION_THRESHOLDS.values()}
+    | {column for column, _ in CONCENTRATION_ETHNICITY_THRESHOLDS.values()}
+)
+THRESHOLD_INDEX_BINS = 32
+
+# Compact column types for the cleaned frame
+PERCENT_COLUMN_PREFIXES = ('age_', 'income_household_', 'race_', 'education_')
+PERCENT_COLUMNS = ['hispanic', 'male', 'female', 'white_pct', 'black_pct', 'hispanic_pct',
+                   'asian_pct', 'college_degree_pct']
+
+# Source workbook, the parquet file it is cleaned into, and its ingestion: rows
+# per DataFrame chunk while streaming the sheet, and worker processes for the
+# column-group stage (0 = in process)
+EXCEL_DATASET_PATH = 'ACSData/WorkingFile_ZipDemographicData_ACS_2023.xlsx'
+PARQUET_DATASET_PATH = 'ACSData/demographic_data.parquet'
+INGEST_CHUNK_ROWS = int(os.environ.get('INGEST_CHUNK_ROWS', 5000))
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 0))
+
+# Bracket columns and the lower edge of each bracket for the grouped medians
+AGE_BRACKET_COLUMNS = ['age_under_10', 'age_10_to_19', 'age_20s', 'age_30s',
+                       'age_40s', 'age_50s', 'age_60s', 'age_70s', 'age_over_80']
+AGE_BRACKET_EDGES = [0, 10, 20, 30, 40, 50, 60, 70, 80]
+INCOME_BRACKET_COLUMNS = ['income_household_under_10k', 'income_household_10k_to_15k',
+                          'income_household_15k_to_20k', 'income_household_20k_to_25k',
+                          'income_household_25k_to_30k', 'income_household_30k_to_35k',
+                          'income_household_35k_to_40k', 'income_household_40k_to_45k',
+                          'income_household_45k_to_50k', 'income_household_50k_to_60k',
+                          'income_household_60k_to_75k', 'income_household_75k_to_100k',
+                          'income_household_100k_to_125k', 'income_household_125k_to_150k',
+                          'income_household_150k_to_200k', 'income_household_over_200k']
+INCOME_BRACKET_EDGES = [0, 10000, 15000, 20000, 25000, 30000, 35000, 40000, 45000,
+                        50000, 60000, 75000, 100000, 125000, 150000, 200000]
+
+# Percent columns turned into 0-1 shares
+SHARE_COLUMNS = {
+    'white_pct': 'race_white',
+    'black_pct': 'race_black',
+    'asian_pct': 'race_asian',
+    'hispanic_pct': 'hispanic',
+    'college_degree_pct': 'education_college_or_above',
+}
+
+# Bumped whenever the compact schema changes so derived files are rebuilt
+DEMOGRAPHIC_SCHEMA_VERSION = 3
+
+# Long per-zip county lists, read from parquet only when a request needs them
+LAZY_COLUMNS = ['county_fips_all', 'county_names_all', 'county_weights']
+
+# Zip -> county weight matrix parsed from the county lists at conversion time
+COUNTY_MATRIX_PATH = 'ACSData/county_weights.npz'
+ROLLUP_LEVELS = ('state', 'county')
+lazy_columns_source = None
+
+# Arrow IPC copy of the cleaned dataset, memory-mapped at startup
+MMAP_DATASET_PATH = 'ACSData/demographic_data.arrow'
+USE_MMAP_DATASET = os.environ.get('USE_MMAP_DATASET', '1') == '1'
+
+# Precomputed ranking of every map/table filter combination
+TARGET_RANKINGS_PATH = 'ACSData/target_rankings.npy'
+TARGET_RANKINGS_META_PATH = 'ACSData/target_rankings.json'
+MATERIALIZED_TOP_K = 1000
+
+# Zip clustering: features (NaNs imputed with the column median, then
+# standardized once per dataset) and where fitted models are persisted
+CLUSTER_FEATURES = ['median_age', 'median_income', 'college_degree_pct',
+                    'white_pct', 'black_pct', 'hispanic_pct', 'asian_pct']
+CLUSTER_MODELS_DIR = 'ACSData/cluster_models'
+MAX_CLUSTERS = 5
+
+# Filtered cluster models kept in memory (least recently used evicted first),
+# and the significant digits range bounds are rounded to in a model's signature
+CLUSTER_MODEL_CACHE_SIZE = int(os.environ.get('CLUSTER_MODEL_CACHE_SIZE', 64))
+CLUSTER_SIGNATURE_DIGITS = 2
+
+# Look-alike search: numeric profile columns besides the percent columns, the
+# most seeds / neighbours per request, and seeds scored per block when
+# combining with 'any' (bounds the zips x seeds distance block)
+LOOKALIKE_EXTRA_FEATURES = ['median_age', 'median_income']
+MAX_LOOKALIKE_SEEDS = 1000
+MAX_LOOKALIKES = 1000
+LOOKALIKE_SEED_CHUNK = 64
+
+# Response formats for /api/zip-codes, chosen by ?format= or the Accept header
+MAP_RESPONSE_FORMATS = {
+    'rows': 'application/json',
+    'columnar': 'application/vnd.realyn.columnar+json',
+    'binary': 'application/octet-stream',
+}
+
+# Largest batch accepted by POST /api/demographics/zips
+MAX_BATCH_ZIP_CODES = int(os.environ.get('MAX_BATCH_ZIP_CODES', 10000))
+
+# Bulk enrichment: upload/response formats, recognised column names and the
+# number of rows joined per chunk while streaming
+ENRICHMENT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+ENRICHMENT_ZIP_FIELDS = ('zip_code', 'zip', 'zipcode', 'zcta')
+ENRICHMENT_COUNT_FIELDS = ('customer_count', 'customers', 'count')
+ENRICHMENT_CHUNK_ROWS = int(os.environ.get('ENRICHMENT_CHUNK_ROWS', 5000))
+
+# Customer-file penetration analysis: rows aggregated per chunk of the upload
+# and the number of points returned on each cumulative-share curve
+CUSTOMER_CHUNK_ROWS = int(os.environ.get('CUSTOMER_CHUNK_ROWS', 100000))
+CONCENTRATION_CURVE_POINTS = 100
+
+# Market-share (Lorenz) curve endpoint: largest sample count and default
+# percentile thresholds
+MAX_CURVE_POINTS = 1000
+MARKET_SHARE_PERCENTILES = [50, 80]
+
+# Streaming export formats (mimetype, file extension) and compression codecs
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+EXPORT_COMPRESSIONS = {
+    'gzip': ('application/gzip', 'gz'),
+    'zstd': ('application/zstd', 'zst'),
+}
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 5000))
+
+# Spatial queries over zip centroids
+EARTH_RADIUS_MILES = 3958.8
+MAX_RADIUS_MILES = 500
+MAX_STORES = 5000
+
+# Level-of-detail map mode: grid cells per 256px map tile at each zoom, the
+# deepest precomputed zoom, and the most zip codes sent before clustering
+LOD_CELLS_PER_TILE = 4
+LOD_MAX_ZOOM = 16
+LOD_MAX_POINTS = int(os.environ.get('LOD_MAX_POINTS', 1000))
+
+# Binary map tiles: coordinate extent within a tile, deepest tile zoom, the
+# most zip codes drawn individually per tile, and how many zooms finer than the
+# tile the LOD grid is when a tile is aggregated (2 -> 16x16 cells per tile)
+TILE_EXTENT = 4096
+MAX_TILE_ZOOM = 22
+TILE_MAX_POINTS = int(os.environ.get('TILE_MAX_POINTS', 500))
+TILE_CLUSTER_ZOOM_OFFSET = 2
 
 def convert_excel_to_parquet():
     """Convert Excel file to parquet for faster loading"""
     try:
-        excel_path = 'ACSData/WorkingFile_ZipDemographicData_ACS_2023.xlsx'
-        parquet_path = 'ACSData/demographic_data.parquet'
+        excel_path = EXCEL_DATASET_PATH
+        parquet_path = PARQUET_DATASET_PATH
         
         if os.path.exists(parquet_path):
             # Check if parquet is newer than Excel
             excel_time = os.path.getmtime(excel_path)
             parquet_time = os.path.getmtime(parquet_path)
-            if parquet_time > excel_time:
+            metadata = pq.read_schema(parquet_path).metadata or {}
+            schema_version = metadata.get(b'demographic_schema_version')
+            if parquet_time > excel_time and schema_version == str(DEMOGRAPHIC_SCHEMA_VERSION).encode():
                 print("Using existing parquet file")
                 return parquet_path
         
         print("Converting Excel to parquet...")
-        df = pd.read_excel(excel_path)
-        
-        # Apply the same data cleaning logic
-        df = clean_demographic_data(df)
+        df, stage_seconds = ingest_demographic_excel(excel_path)
         
         if df is not None:
-            # Save as parquet
-            df.to_parquet(parquet_path, index=False)
+            # Save as parquet, tagged with the schema version it was cleaned under.
+            # Written to a temporary file and swapped in so a failed or concurrent
+            # conversion never leaves a partial file behind
+            start = time.perf_counter()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                b'demographic_schema_version': str(DEMOGRAPHIC_SCHEMA_VERSION).encode(),
+            })
+            tmp_path = f"{parquet_path}.tmp-{os.getpid()}"
+            try:
+                pq.write_table(table, tmp_path)
+                os.replace(tmp_path, parquet_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            stage_seconds['write_parquet'] = round(time.perf_counter() - start, 3)
             print(f"Saved parquet file: {parquet_path}")
+            
+            # And as memory-mappable columns for fast worker startup
+            if USE_MMAP_DATASET:
+                start = time.perf_counter()
+                save_mmap_dataset(df, parquet_path)
+                stage_seconds['write_mmap'] = round(time.perf_counter() - start, 3)
+            
+            # County lists parsed once into the sparse rollup matrix
+            start = time.perf_counter()
+            save_county_matrix(build_county_matrix(df), df['zip_key'].to_numpy())
+            stage_seconds['county_matrix'] = round(time.perf_counter() - start, 3)
+            
+            # Map/table rankings of every filter combination, so workers only
+            # memory-map them instead of building them on their first request
+            start = time.perf_counter()
+            try:
+                engine = build_target_engine(df)
+                engine['bitsets'] = build_filter_bitsets(df, engine)
+                materialize_target_rankings(engine)
+            except Exception as e:
+                # Rankings are an optimization; the engine builds them if missing
+                print(f"Error materializing target rankings: {e}")
+            stage_seconds['target_rankings'] = round(time.perf_counter() - start, 3)
+            
+            print("Excel conversion stages: " + ", ".join(
+                f"{stage} {seconds:.3f}s" for stage, seconds in stage_seconds.items()))
             return parquet_path
         else:
             print("Failed to clean data, cannot save parquet")
@@ -52,101 +375,114 @@ def convert_excel_to_parquet():
         traceback.print_exc()
         return None
 
-def clean_demographic_data(df):
-    """Clean and standardize the actual Excel data structure"""
+def iter_excel_chunks(excel_path, chunk_rows=INGEST_CHUNK_ROWS):
+    """First worksheet of ``excel_path`` as DataFrame chunks of ``chunk_rows`` rows.
+    
+    Without ``python-calamine`` the sheet is streamed with openpyxl in read-only
+    mode as plain value tuples (no cell objects), so only one chunk of raw rows
+    is held at a time. Calamine reads the whole sheet in one native call, which
+    is much faster; its frame is then handed out in the same chunks. Chunks keep
+    their row positions in the sheet as index, and a sheet without rows yields
+    one empty frame with the header columns.
+    """
+    if python_calamine is not None:
+        df = pd.read_excel(excel_path, engine='calamine')
+        for offset in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[offset:offset + chunk_rows]
+        return
+    
+    import openpyxl
+    workbook = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
     try:
-        # Remove duplicate columns first
-        df = df.loc[:, ~df.columns.duplicated()]
-        print(f"Columns after removing duplicates: {df.columns.tolist()}")
-        
-        # Standardize column names
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
-        
-        # Fix problematic columns that cause parquet conversion issues
-        problematic_columns = ['county_fips_all', 'county_names_all', 'county_weights']
-        for col in problematic_columns:
-            if col in df.columns:
-                # Convert to string to avoid mixed type issues
-                df[col] = df[col].astype(str)
-        
-        # Map zip code column - use 'zcta' 
-        if 'zcta' in df.columns:
-            df['zip_code'] = df['zcta'].astype(str).str.zfill(5)
-        else:
-            print("No zcta column found")
-            return None
-        
-        # Map coordinates - these exist!
-        if 'lat' in df.columns and 'lng' in df.columns:
-            df['latitude'] = pd.to_numeric(df['lat'], errors='coerce')
-            df['longitude'] = pd.to_numeric(df['lng'], errors='coerce')
-        
-        # Map population
-        if 'population' in df.columns:
-            df['population'] = pd.to_numeric(df['population'], errors='coerce')
-        else:
-            print("No population column found")
-            return None
-        
-        # Calculate median age from age brackets using your actual column names
-        age_columns = ['age_under_10', 'age_10_to_19', 'age_20s', 'age_30s', 
-                      'age_40s', 'age_50s', 'age_60s', 'age_70s', 'age_over_80']
-        
-        if all(col in df.columns for col in age_columns):
-            # Calculate approximate median age
-            age_midpoints = [5, 15, 25, 35, 45, 55, 65, 75, 85]
-            df['median_age'] = 0
-            
-            for i, col in enumerate(age_columns):
-                # Convert percentage to decimal and multiply by population
-                age_count = pd.to_numeric(df[col], errors='coerce') * df['population'] / 100
-                df['median_age'] += age_count * age_midpoints[i]
-            
-            df['median_age'] = df['median_age'] / df['population']
-        
-        # Calculate median income from income brackets using your actual column names
-        income_columns = ['income_household_under_10k', 'income_household_10k_to_15k',
-                         'income_household_15k_to_20k', 'income_household_20k_to_25k',
-                         'income_household_25k_to_30k', 'income_household_30k_to_35k',
-                         'income_household_35k_to_40k', 'income_household_40k_to_45k',
-                         'income_household_45k_to_50k', 'income_household_50k_to_60k',
-                         'income_household_60k_to_75k', 'income_household_75k_to_100k',
-                         'income_household_100k_to_125k', 'income_household_125k_to_150k',
-                         'income_household_150k_to_200k', 'income_household_over_200k']
-        
-        if all(col in df.columns for col in income_columns):
-            # Calculate approximate median income
-            income_midpoints = [5000, 12500, 17500, 22500, 27500, 32500, 37500, 42500,
-                              47500, 55000, 67500, 87500, 112500, 137500, 175000, 250000]
-            df['median_income'] = 0
-            
-            for i, col in enumerate(income_columns):
-                # Convert percentage to decimal and multiply by population
-                income_count = pd.to_numeric(df[col], errors='coerce') * df['population'] / 100
-                df['median_income'] += income_count * income_midpoints[i]
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        columns = [f"Unnamed: {i}" if name is None else name for i, name in enumerate(header)]
+        
+        offset = 0
+        while True:
+            batch = list(itertools.islice(rows, chunk_rows))
+            if not batch:
+                break
+            # Blank rows (e.g. formatted but empty trailing rows) are skipped
+            batch = [row for row in batch if any(value is not None for value in row)]
+            if batch:
+                yield pd.DataFrame.from_records(batch, columns=columns,
+                                                index=pd.RangeIndex(offset, offset + len(batch)))
+                offset += len(batch)
+        
+        if not offset:
+            yield pd.DataFrame(columns=columns)
+    finally:
+        workbook.close()
+
+def ingest_demographic_excel(excel_path, workers=None):
+    """Read and clean the ACS workbook as individually timed stages.
+    
+    Each chunk from ``iter_excel_chunks`` is normalized, derived and compacted
+    before the next one is read, so only compact chunks are kept until they are
+    concatenated; stage times are summed over the chunks. Returns (df or None,
+    stage_seconds). ``workers`` (default INGEST_WORKERS) runs the column-group
+    stage in that many processes.
+    """
+    stage_seconds = dict.fromkeys(['read', 'normalize', 'column_groups', 'finalize'], 0.0)
+    pool = column_group_pool(INGEST_WORKERS if workers is None else workers)
+    try:
+        chunks = []
+        row_count = 0
+        reader = iter_excel_chunks(excel_path)
+        while True:
+            start = time.perf_counter()
+            chunk = next(reader, None)
+            stage_seconds['read'] += time.perf_counter() - start
+            if chunk is None:
+                break
             
-            df['median_income'] = df['median_income'] / df['population']
+            row_count += len(chunk)
+            if not chunks:
+                print(f"Columns after removing duplicates: {chunk.columns.drop_duplicates().tolist()}")
+            chunk = clean_demographic_stages(chunk, stage_seconds, pool, partial=True)
+            if chunk is None:
+                return None, round_stage_seconds(stage_seconds)
+            chunks.append(chunk)
         
-        # Race percentages are already percentages, just convert to decimal
-        if 'race_white' in df.columns:
-            df['white_pct'] = pd.to_numeric(df['race_white'], errors='coerce') / 100
-        if 'race_black' in df.columns:
-            df['black_pct'] = pd.to_numeric(df['race_black'], errors='coerce') / 100
-        if 'race_asian' in df.columns:
-            df['asian_pct'] = pd.to_numeric(df['race_asian'], errors='coerce') / 100
-        if 'hispanic' in df.columns:
-            df['hispanic_pct'] = pd.to_numeric(df['hispanic'], errors='coerce') / 100
+        print(f"Read {row_count} rows from {excel_path} in {stage_seconds['read']:.3f}s")
         
-        # Education percentage - use your actual column
-        if 'education_college_or_above' in df.columns:
-            df['college_degree_pct'] = pd.to_numeric(df['education_college_or_above'], errors='coerce') / 100
+        # Rows were compacted chunk by chunk; the text columns need every row
+        start = time.perf_counter()
+        df = apply_demographic_schema(pd.concat(chunks))
+        stage_seconds['finalize'] += time.perf_counter() - start
         
-        # Add state information
-        if 'state_name' in df.columns:
-            df['state'] = df['state_name']
+        print(f"Successfully processed {len(df)} zip codes")
+        print(f"Final columns: {df.columns.tolist()}")
+        return df, round_stage_seconds(stage_seconds)
         
-        # Clean up any NaN values
-        df = df.dropna(subset=['zip_code', 'population'])
+    except Exception as e:
+        print(f"Error cleaning demographic data: {e}")
+        import traceback
+        traceback.print_exc()
+        return None, round_stage_seconds(stage_seconds)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def round_stage_seconds(stage_seconds):
+    return {stage: round(seconds, 3) for stage, seconds in stage_seconds.items()}
+
+def clean_demographic_data(df, stage_seconds=None, workers=0):
+    """Clean and standardize the actual Excel data structure.
+    
+    Runs as stages, each timed into ``stage_seconds`` when given: column
+    normalization, the per-column-group numeric work (in ``workers`` processes
+    when more than one), then row filtering and the compact schema.
+    """
+    stage_seconds = {} if stage_seconds is None else stage_seconds
+    pool = column_group_pool(workers)
+    try:
+        print(f"Columns after removing duplicates: {df.columns.drop_duplicates().tolist()}")
+        df = clean_demographic_stages(df, stage_seconds, pool)
+        stage_seconds.update(round_stage_seconds(stage_seconds))
+        if df is None:
+            return None
         
         print(f"Successfully processed {len(df)} zip codes")
         print(f"Final columns: {df.columns.tolist()}")
@@ -158,13 +494,346 @@ def clean_demographic_data(df):
         import traceback
         traceback.print_exc()
         return None
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def clean_demographic_stages(df, stage_seconds, pool=None, partial=False):
+    """Normalize, column groups and finalize, each stage's time added to
+    ``stage_seconds``. ``partial`` frames are chunks of the sheet (see
+    ``apply_demographic_schema``)."""
+    start = time.perf_counter()
+    df = normalize_demographic_columns(df)
+    stage_seconds['normalize'] = stage_seconds.get('normalize', 0.0) + time.perf_counter() - start
+    if df is None:
+        return None
+    
+    start = time.perf_counter()
+    for column, values in derive_column_groups(df, pool).items():
+        df[column] = values
+    stage_seconds['column_groups'] = stage_seconds.get('column_groups', 0.0) + time.perf_counter() - start
+    
+    start = time.perf_counter()
+    df = finalize_demographic_data(df, partial)
+    stage_seconds['finalize'] = stage_seconds.get('finalize', 0.0) + time.perf_counter() - start
+    return df
+
+def normalize_demographic_columns(df):
+    """Deduplicated, standardized column names plus the text columns and
+    ``zip_code``; None when there is no zcta column"""
+    # Remove duplicate columns first
+    df = df.loc[:, ~df.columns.duplicated()]
+    
+    # Standardize column names
+    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+    
+    # Fix problematic columns that cause parquet conversion issues
+    problematic_columns = ['county_fips_all', 'county_names_all', 'county_weights']
+    for col in problematic_columns:
+        if col in df.columns:
+            # Convert to string to avoid mixed type issues
+            df[col] = df[col].astype(str)
+    
+    # Map zip code column - use 'zcta' 
+    if 'zcta' in df.columns:
+        df['zip_code'] = df['zcta'].astype(str).str.zfill(5)
+    else:
+        print("No zcta column found")
+        return None
+    
+    if 'population' not in df.columns:
+        print("No population column found")
+        return None
+    
+    return df
+
+def derive_location_columns(frame):
+    """Coordinates and population as numbers"""
+    columns = {}
+    if 'lat' in frame.columns and 'lng' in frame.columns:
+        columns['latitude'] = pd.to_numeric(frame['lat'], errors='coerce')
+        columns['longitude'] = pd.to_numeric(frame['lng'], errors='coerce')
+    columns['population'] = pd.to_numeric(frame['population'], errors='coerce')
+    return columns
+
+def derive_age_columns(frame):
+    """Median age interpolated from the age brackets (lower edge of each bracket;
+    the last one is open-ended)"""
+    if not all(col in frame.columns for col in AGE_BRACKET_COLUMNS):
+        return {}
+    return {'median_age': interpolated_median(frame[AGE_BRACKET_COLUMNS], AGE_BRACKET_EDGES)}
+
+def derive_income_columns(frame):
+    """Median household income interpolated from the income brackets"""
+    if not all(col in frame.columns for col in INCOME_BRACKET_COLUMNS):
+        return {}
+    return {'median_income': interpolated_median(frame[INCOME_BRACKET_COLUMNS], INCOME_BRACKET_EDGES)}
+
+def derive_share_columns(frame):
+    """Race and education percentages as 0-1 shares"""
+    return {share: pd.to_numeric(frame[source], errors='coerce') / 100
+            for share, source in SHARE_COLUMNS.items() if source in frame.columns}
+
+# Independent column groups of the cleaning stage: each derivation only reads
+# its own source columns, so the groups can run in separate processes
+DEMOGRAPHIC_COLUMN_GROUPS = [
+    (derive_location_columns, ['lat', 'lng', 'population']),
+    (derive_age_columns, AGE_BRACKET_COLUMNS),
+    (derive_income_columns, INCOME_BRACKET_COLUMNS),
+    (derive_share_columns, list(SHARE_COLUMNS.values())),
+]
+
+def column_group_pool(workers):
+    """Process pool for ``derive_column_groups`` when ``workers`` > 1, else None"""
+    if workers > 1:
+        return ProcessPoolExecutor(max_workers=min(workers, len(DEMOGRAPHIC_COLUMN_GROUPS)))
+    return None
+
+def derive_column_groups(df, pool=None):
+    """Derived columns of every DEMOGRAPHIC_COLUMN_GROUPS group, in group order.
+    
+    With a ``pool`` the groups run in its processes; each worker is sent only
+    its group's source columns.
+    """
+    tasks = [(derive, df[[col for col in columns if col in df.columns]])
+             for derive, columns in DEMOGRAPHIC_COLUMN_GROUPS]
+    
+    if pool is not None:
+        results = [future.result() for future in [pool.submit(derive, frame) for derive, frame in tasks]]
+    else:
+        results = [derive(frame) for derive, frame in tasks]
+    
+    derived = {}
+    for result in results:
+        derived.update(result)
+    return derived
+
+def finalize_demographic_data(df, partial=False):
+    """State column, rows without a zip or population dropped, compact schema"""
+    # Add state information
+    if 'state_name' in df.columns:
+        df['state'] = df['state_name']
+    
+    # Clean up any NaN values
+    df = df.dropna(subset=['zip_code', 'population'])
+    
+    # Compact column types (kept when saved to parquet)
+    return apply_demographic_schema(df, partial)
+
+def interpolated_median(shares, lower_edges):
+    """Grouped median of bracketed distributions, one per row.
+
+    ``shares`` holds each row's percent (or count) per bracket and
+    ``lower_edges`` each bracket's lower bound; a bracket ends where the next
+    begins and the last is open-ended. The median is located with a cumulative
+    sum and linearly interpolated inside the bracket holding the 50% point,
+    as in Census grouped medians. A median in the open-ended bracket is
+    reported as its lower bound (the Census "200,000+" convention). Rows with
+    no data are NaN.
+    """
+    if isinstance(shares, pd.DataFrame):
+        # Excel columns can arrive as text; only those need coercing
+        text_columns = [col for col in shares.columns if not pd.api.types.is_numeric_dtype(shares[col])]
+        if text_columns:
+            shares = shares.assign(**{col: pd.to_numeric(shares[col], errors='coerce') for col in text_columns})
+    # Brackets x rows, so every step below runs over contiguous rows
+    shares = np.array(np.asarray(shares, dtype=np.float64).T, order='C')
+    shares[np.isnan(shares)] = 0
+    edges = np.asarray(lower_edges, dtype=np.float64)
+    widths = np.append(np.diff(edges), 0.0)
+
+    # Running total bracket by bracket (one row-wide add each, faster than a
+    # strided cumsum)
+    cumulative = np.empty_like(shares)
+    np.copyto(cumulative[0], shares[0])
+    for i in range(1, len(shares)):
+        np.add(cumulative[i - 1], shares[i], out=cumulative[i])
+    half = cumulative[-1] / 2
+    rows = np.arange(shares.shape[1])
+
+    # First bracket whose cumulative share reaches half of the total
+    bracket = np.minimum((cumulative < half).sum(axis=0), len(edges) - 1)
+    below = np.where(bracket > 0, cumulative[np.maximum(bracket - 1, 0), rows], 0.0)
+    within = shares[bracket, rows]
+    fraction = np.divide(half - below, within, out=np.zeros(len(rows)), where=within > 0)
+
+    median = edges[bracket] + np.clip(fraction, 0, 1) * widths[bracket]
+    return np.where(half > 0, median, np.nan)
+
+def is_percent_column(col):
+    return col in PERCENT_COLUMNS or col.startswith(PERCENT_COLUMN_PREFIXES)
+
+def zip_code_strings(keys):
+    """Zero-padded 5-digit zip code strings for integer ``keys``"""
+    return [f"{key:05d}" for key in np.asarray(keys).tolist()]
+
+def frame_columns(frame, columns):
+    """``frame[columns]``, formatting ``zip_code`` from ``zip_key`` when the
+    frame doesn't store the text column"""
+    if 'zip_code' not in columns or 'zip_code' in frame.columns:
+        return frame[columns]
+    selected = frame[[col for col in columns if col != 'zip_code']].copy()
+    selected['zip_code'] = zip_code_strings(frame['zip_key'])
+    return selected[columns]
+
+def apply_demographic_schema(df, partial=False):
+    """Cast the cleaned frame to its compact column types.
+    
+    Percent columns become float32, population and the integer zip key uint32,
+    and state a categorical. The ``zip_code`` text column is replaced by
+    ``zip_key`` when it is just the zero-padded key, and formatted back on
+    output (see ``frame_columns``). Columns already in their compact type are
+    left alone, so this is cheap on frames loaded from a compact parquet file.
+    
+    A ``partial`` frame (one chunk of the sheet) only gets the numeric casts:
+    the state categories and whether ``zip_code`` can be dropped depend on
+    every row, so those wait for the concatenated frame.
+    """
+    before = df.memory_usage(deep=True).sum()
+    df = df.copy(deep=False)
+    
+    for col in df.columns:
+        if is_percent_column(col) and pd.api.types.is_numeric_dtype(df[col]) and df[col].dtype != np.float32:
+            df[col] = df[col].astype(np.float32)
+    
+    if df['population'].dtype != np.uint32:
+        population = pd.to_numeric(df['population'], errors='coerce').fillna(0).clip(lower=0)
+        df['population'] = population.round().astype(np.uint32)
+    
+    if 'zip_key' not in df.columns:
+        df['zip_key'] = pd.to_numeric(df['zip_code'], errors='coerce').fillna(0).astype(np.uint32)
+    
+    if partial:
+        return df
+    
+    if 'zip_code' in df.columns and (
+            df['zip_code'].astype(str).to_numpy(dtype=object) == np.array(zip_code_strings(df['zip_key']), dtype=object)).all():
+        # Keep the key where the text column was, so export column order doesn't change
+        position = df.columns.get_loc('zip_code')
+        zip_key = df.pop('zip_key')
+        df = df.drop(columns='zip_code')
+        df.insert(position, 'zip_key', zip_key)
+    
+    if 'state' in df.columns and not isinstance(df['state'].dtype, pd.CategoricalDtype):
+        df['state'] = df['state'].astype('category')
+    
+    after = df.memory_usage(deep=True).sum()
+    if after != before:
+        print(f"Compacted demographic data: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+    
+    return df
+
+@lru_cache(maxsize=1)
+def read_lazy_columns(parquet_path, parquet_mtime):
+    """Read only the lazily loaded columns from parquet (cached per file version)"""
+    available = [col for col in LAZY_COLUMNS if col in pq.read_schema(parquet_path).names]
+    return pd.read_parquet(parquet_path, columns=available)
+
+def attach_lazy_columns(df):
+    """Join the lazily loaded county list columns onto rows of demographic_df.
+    
+    The county columns are long strings that almost no request needs, so they
+    are left out of the in-memory frame and read from parquet on demand.
+    """
+    missing = [col for col in LAZY_COLUMNS if col not in df.columns]
+    if not missing or lazy_columns_source is None:
+        return df
+    
+    lazy = read_lazy_columns(lazy_columns_source, os.path.getmtime(lazy_columns_source))
+    return df.join(lazy[[col for col in missing if col in lazy.columns]])
+
+def save_mmap_dataset(df, source_path):
+    """Write ``df`` as an uncompressed Arrow IPC file that can be memory-mapped.
+
+    Numeric columns are written from their NumPy buffers with NaN kept as a
+    value (no validity bitmap), so they can later be viewed without copying.
+    The schema metadata records the parquet file it was built from so stale
+    copies are ignored.
+    """
+    try:
+        # Lazily loaded columns are read from parquet on demand instead
+        columns = [col for col in df.columns if col not in LAZY_COLUMNS]
+        
+        arrays = []
+        for col in columns:
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                arrays.append(pa.array(series))
+            elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+                arrays.append(pa.array(np.ascontiguousarray(series.to_numpy())))
+            else:
+                arrays.append(pa.array(series.to_numpy(dtype=object), from_pandas=True))
+        
+        table = pa.Table.from_arrays(arrays, names=[str(col) for col in columns])
+        table = table.replace_schema_metadata({
+            'schema_version': str(DEMOGRAPHIC_SCHEMA_VERSION),
+            'source_mtime': repr(os.path.getmtime(source_path)),
+            'source_size': str(os.path.getsize(source_path)),
+        })
+        
+        # Write to a temporary file and swap it in so readers never map a partial file
+        tmp_path = f"{MMAP_DATASET_PATH}.tmp-{os.getpid()}"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, MMAP_DATASET_PATH)
+        
+        print(f"Saved memory-mapped dataset: {MMAP_DATASET_PATH}")
+        return True
+        
+    except Exception as e:
+        print(f"Error saving memory-mapped dataset: {e}")
+        return False
+
+def load_mmap_dataset(source_path):
+    """Open the Arrow IPC dataset memory-mapped.
+    
+    pyarrow only converts a column without copying when it is numeric or
+    boolean, has no nulls and its buffer is suitably aligned; those columns
+    stay views of the mapped file in the OS page cache, shared by every
+    process. String and categorical columns, and any column pyarrow can't
+    convert in place, are copied into this process (``benchmark_startup.py``
+    reports which are which). Returns None when the file is missing or was
+    built from a different parquet file.
+    """
+    try:
+        if not os.path.exists(MMAP_DATASET_PATH):
+            return None
+        
+        table = pa.ipc.open_file(pa.memory_map(MMAP_DATASET_PATH)).read_all()
+        metadata = table.schema.metadata or {}
+        
+        if (metadata.get(b'schema_version') != str(DEMOGRAPHIC_SCHEMA_VERSION).encode()
+                or metadata.get(b'source_mtime') != repr(os.path.getmtime(source_path)).encode()
+                or metadata.get(b'source_size') != str(os.path.getsize(source_path)).encode()):
+            print("Memory-mapped dataset is stale")
+            return None
+        
+        df = table.to_pandas(split_blocks=True)
+        print(f"Loaded {len(df)} zip codes from memory-mapped dataset")
+        return df
+        
+    except Exception as e:
+        print(f"Error loading memory-mapped dataset: {e}")
+        return None
 
 def load_demographic_data():
     """Load demographic data from parquet file"""
+    global lazy_columns_source
+    
     try:
         parquet_path = convert_excel_to_parquet()
         if parquet_path and os.path.exists(parquet_path):
-            df = pd.read_parquet(parquet_path)
+            # County list columns stay on disk until a request needs them
+            lazy_columns_source = parquet_path
+            
+            if USE_MMAP_DATASET:
+                df = load_mmap_dataset(parquet_path)
+                if df is not None:
+                    return df
+            
+            eager_columns = [col for col in pq.read_schema(parquet_path).names if col not in LAZY_COLUMNS]
+            df = pd.read_parquet(parquet_path, columns=eager_columns)
             print(f"Loaded {len(df)} zip codes from parquet")
             
             # Ensure the data is properly cleaned even when loaded from parquet
@@ -172,9 +841,19 @@ def load_demographic_data():
             if 'latitude' not in df.columns and 'lat' in df.columns:
                 print("Converting lat/lng to latitude/longitude...")
                 df = clean_demographic_data(df)
+            else:
+                # Parquet files written before the compact schema
+                df = apply_demographic_schema(df)
+            
+            if USE_MMAP_DATASET and df is not None and 'latitude' in df.columns and save_mmap_dataset(df, parquet_path):
+                # Serve the memory-mapped copy so processes share its pages
+                mapped_df = load_mmap_dataset(parquet_path)
+                if mapped_df is not None:
+                    return mapped_df
             
             return df
         else:
+            lazy_columns_source = None
             print("Parquet file not found, falling back to Excel")
             return load_demographic_data_from_excel()
     except Exception as e:
@@ -182,21 +861,20 @@ def load_demographic_data():
         import traceback
         traceback.print_exc()
         # Fallback to Excel
+        lazy_columns_source = None
         return load_demographic_data_from_excel()
 
 def load_demographic_data_from_excel():
     """Fallback to loading from Excel"""
     try:
-        excel_path = 'ACSData/WorkingFile_ZipDemographicData_ACS_2023.xlsx'
+        excel_path = EXCEL_DATASET_PATH
         if not os.path.exists(excel_path):
             print(f"Excel file not found at: {excel_path}")
             return None
             
         print(f"Loading Excel file from: {excel_path}")
-        df = pd.read_excel(excel_path)
-        
-        # Apply cleaning
-        return clean_demographic_data(df)
+        df, _ = ingest_demographic_excel(excel_path)
+        return df
         
     except Exception as e:
         print(f"Error loading Excel data: {e}")
@@ -207,192 +885,1628 @@ def load_zip_coordinates():
     global demographic_df
     
     if demographic_df is not None and 'latitude' in demographic_df.columns and 'longitude' in demographic_df.columns:
-        coords_df = demographic_df[['zip_code', 'latitude', 'longitude']].copy()
+        coords_df = frame_columns(demographic_df, ['zip_code', 'latitude', 'longitude']).copy()
         coords_df = coords_df.dropna(subset=['latitude', 'longitude'])
         print(f"Loaded coordinates for {len(coords_df)} zip codes")
         return coords_df
     return None
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+def build_target_engine(df):
+    """Precompute the per-bucket fraction matrix used for target population.
 
-@app.route('/pricing')
-def pricing():
-    return render_template('pricing.html')
+    Each column of ``fractions`` is one filter bucket (e.g. age '60plus') holding
+    the share of a zip's population in that bucket (percent / 100). Rows line up
+    with the positions of ``df``, so a filter combination is the population
+    vector multiplied by at most four contiguous float32 columns.
+    """
+    bucket_index = {}
+    bucket_groups = list(TARGET_BUCKETS.items()) + list(TARGET_EXTRA_BUCKETS.items())
+    fractions = np.zeros((len(df), sum(len(b) for _, b in bucket_groups)),
+                         dtype=np.float32, order='F')
 
-@app.route('/tools')
-def tools():
-    return render_template('tools.html')
+    for dimension, buckets in bucket_groups:
+        for value, source_columns in buckets.items():
+            position = len(bucket_index)
+            bucket_index[(dimension, value)] = position
 
-@app.route('/api/health')
-def health_check():
-    return jsonify({"status": "healthy", "message": "Server is running"})
+            existing = [col for col in source_columns if col in df.columns]
+            if not existing:
+                # Missing source columns match nobody, same as a zero multiplier
+                continue
 
-@app.route('/api/demographics/zip/<zip_code>')
-def get_zip_demographics(zip_code):
-    """Get demographic data for a specific zip code"""
-    global demographic_df
+            bucket_pct = np.zeros(len(df), dtype=np.float64)
+            for col in existing:
+                bucket_pct += pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+            fractions[:, position] = bucket_pct / 100
+
+    population = pd.to_numeric(df['population'], errors='coerce').to_numpy(dtype=np.float64)
+
+    # Fingerprint of everything the cached responses are derived from
+    fingerprint = hashlib.sha256(fractions.tobytes())
+    fingerprint.update(population.tobytes())
+    display_columns = [col for col in ['zip_code', 'zip_key', 'latitude', 'longitude', 'state', 'city'] if col in df.columns]
+    fingerprint.update(pd.util.hash_pandas_object(df[display_columns], index=False).to_numpy().tobytes())
+
+    print(f"Built target engine: {fractions.shape[1]} buckets x {fractions.shape[0]} zip codes "
+          f"({fractions.nbytes / 1e6:.1f} MB)")
+
+    return {
+        'fractions': fractions,
+        'bucket_index': bucket_index,
+        'population': population,
+        'source': df,
+        'version': fingerprint.hexdigest()[:16],
+    }
+
+def get_target_engine():
+    """Return the target engine for the loaded demographic data, building it once.
+
+    The engine is rebuilt whenever ``demographic_df`` is replaced, which also
+    invalidates every cached result computed from the previous dataset.
+    """
+    global target_engine
+
+    df = demographic_df
+    if df is None:
+        return None
+
+    if target_engine is None or target_engine['source'] is not df:
+        with target_engine_lock:
+            if target_engine is None or target_engine['source'] is not df:
+                engine = build_target_engine(df)
+                engine['bitsets'] = build_filter_bitsets(df, engine)
+                engine['rankings'] = load_target_rankings(engine)
+                engine['zip_index'] = build_zip_index(df)
+                engine['spatial_index'] = build_spatial_index(df)
+                engine['clusters'] = build_cluster_features(df)
+                prune_cluster_models(engine['clusters'])
+                get_cluster_model(engine['clusters'], {}, MAX_CLUSTERS)
+                engine['lookalike'] = build_lookalike_index(df)
+                engine['rollups'] = build_rollups(df, engine['population'])
+                target_engine = engine
+                result_cache.clear()
+                tile_cache.clear()
+    return target_engine
+
+def build_threshold_index(values, bins):
+    """Sorted-rank and packed-bitset index of one numeric column.
+
+    ``order`` lists the rows by ascending value (NaN rows excluded) next to
+    ``sorted_values``. ``bitsets[k]`` has the bits of the rows whose value is
+    at least ``edges[k]``, for quantile ``edges`` of the column; the extra last
+    bitset is empty. A threshold between two edges is the next edge's bitset
+    plus the few rows of that bin, read off the sorted ranks.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(values))
+    order = valid[np.argsort(values[valid], kind='stable')].astype(np.int32)
+    sorted_values = values[order]
     
-    if demographic_df is None:
-        demographic_df = load_demographic_data()
+    if len(order):
+        edges = np.unique(sorted_values[np.linspace(0, len(order) - 1, bins).astype(np.intp)])
+    else:
+        edges = np.empty(0)
+    starts = np.searchsorted(sorted_values, edges, side='left')
     
-    if demographic_df is None:
-        return jsonify({"error": "Demographic data not available"}), 500
+    bitsets = np.zeros((len(edges) + 1, (len(values) + 7) // 8), dtype=np.uint8)
+    selected = np.zeros(len(values), dtype=bool)
+    for k in range(len(edges) - 1, -1, -1):
+        # Rows at or above each edge, filled from the top bin down
+        selected[order[starts[k]:starts[k + 1] if k + 1 < len(edges) else len(order)]] = True
+        bitsets[k] = np.packbits(selected)
+    
+    valid_bits = np.zeros(len(values), dtype=bool)
+    valid_bits[valid] = True
+    return {
+        'order': order,
+        'sorted_values': sorted_values,
+        'edges': edges,
+        'bitsets': bitsets,
+        'valid': np.packbits(valid_bits),
+    }
+
+def build_filter_bitsets(df, engine):
+    """Packed bitsets for filter predicates: a threshold index per
+    THRESHOLD_INDEX_COLUMNS column and one "has anyone in this bucket" bitset
+    per target bucket. One bit per row of ``df``."""
+    start = time.perf_counter()
+    columns = {
+        column: build_threshold_index(pd.to_numeric(df[column], errors='coerce'), THRESHOLD_INDEX_BINS)
+        for column in THRESHOLD_INDEX_COLUMNS if column in df.columns
+    }
+    buckets = {
+        key: np.packbits(engine['fractions'][:, position] > 0)
+        for key, position in engine['bucket_index'].items()
+    }
     
-    zip_data = demographic_df[demographic_df['zip_code'] == zip_code]
+    bitsets = {
+        'row_count': len(df),
+        'all': np.packbits(np.ones(len(df), dtype=bool)),
+        'columns': columns,
+        'buckets': buckets,
+    }
+    size = sum(index['bitsets'].nbytes + index['order'].nbytes + index['sorted_values'].nbytes
+               for index in columns.values())
+    print(f"Built filter bitsets: {len(columns)} threshold columns, {len(buckets)} buckets "
+          f"({size / 1e6:.1f} MB in {(time.perf_counter() - start) * 1000:.0f} ms)")
+    return bitsets
+
+def rows_at_least(index, value, side):
+    """Packed bitset of the rows whose value is >= ``value`` (side 'left') or
+    > ``value`` (side 'right')"""
+    edges, sorted_values = index['edges'], index['sorted_values']
+    k = edges.searchsorted(value, side=side)
+    bits = index['bitsets'][k].copy()
     
-    if zip_data.empty:
-        return jsonify({"error": "Zip code not found"}), 404
+    # Rows between the threshold and the next edge, from the sorted ranks
+    low = sorted_values.searchsorted(value, side=side)
+    high = sorted_values.searchsorted(edges[k], side='left') if k < len(edges) else len(sorted_values)
+    rows = index['order'][low:high]
+    if len(rows):
+        np.bitwise_or.at(bits, rows >> 3, (0x80 >> (rows & 7)).astype(np.uint8))
+    return bits
+
+def threshold_bitset(bitsets, column, bound, value):
+    """Packed bitset of rows with ``column`` >= ``value`` (bound 'min') or
+    <= ``value`` (bound 'max'); None if the column has no threshold index"""
+    index = bitsets['columns'].get(column)
+    if index is None:
+        return None
+    if bound == 'min':
+        return rows_at_least(index, value, 'left')
+    return index['valid'] & ~rows_at_least(index, value, 'right')
+
+def target_filter_selection(dimension, value):
+    """Bucket values selected for ``dimension`` (one value or a multi-select
+    list, aliases resolved), or None when the dimension is unconstrained"""
+    values = value if isinstance(value, (list, tuple)) else [value]
+    aliases = TARGET_VALUE_ALIASES.get(dimension, {})
+    selected = list(dict.fromkeys(aliases.get(v, v) for v in values if v))
+    if not selected or TARGET_PASSTHROUGH[dimension] in selected:
+        return None
+    return selected
+
+def check_filter_values(dimension, selected, known):
+    """Raise ValueError naming any of ``selected`` that ``known`` (keyed by
+    value, or by ``(dimension, value)``) doesn't have"""
+    unknown = [value for value in selected if value not in known and (dimension, value) not in known]
+    if unknown:
+        raise ValueError(f"Unknown {dimension} filter value: {', '.join(map(str, unknown))}")
+
+def range_filter_spec(filters):
+    """The numeric range part of a filter spec (FILTER_RANGE_KEYS and ``ranges``)"""
+    return {key: filters[key] for key in list(FILTER_RANGE_KEYS) + ['ranges'] if filters.get(key)}
+
+def merge_min_bound(spec, column, value):
+    """``spec`` with a lower bound on ``column`` merged into its ``ranges``,
+    keeping the tighter bound when the spec already has one"""
+    ranges = spec.get('ranges') or {}
+    if not isinstance(ranges, dict):
+        raise ValueError("ranges must be an object of {column: {min, max}}")
+    bounds = ranges.get(column) or {}
+    if not isinstance(bounds, dict):
+        raise ValueError(f"Range for {column} must be an object with min and/or max")
+    if bounds.get('min') is not None:
+        try:
+            value = max(value, float(bounds['min']))
+        except (TypeError, ValueError):
+            raise ValueError("Range filter bounds must be numbers")
+    return {**spec, 'ranges': {**ranges, column: {**bounds, 'min': value}}}
+
+def filter_range_bounds(filters):
+    """``(column, bound, value)`` terms from the flat min/max keys and the
+    ``ranges`` object (``{"column": {"min": .., "max": ..}}``) of a filter spec"""
+    terms = []
+    for key, (column, bound, scale) in FILTER_RANGE_KEYS.items():
+        if filters.get(key):
+            terms.append((column, bound, filters[key], scale))
     
-    data = zip_data.iloc[0].to_dict()
+    ranges = filters.get('ranges') or {}
+    if not isinstance(ranges, dict):
+        raise ValueError("ranges must be an object of {column: {min, max}}")
+    for column, bounds in ranges.items():
+        if not isinstance(bounds, dict):
+            raise ValueError(f"Range for {column} must be an object with min and/or max")
+        for bound in ('min', 'max'):
+            if bounds.get(bound) is not None:
+                terms.append((column, bound, bounds[bound], 1))
     
-    return jsonify({
-        "zip_code": zip_code,
-        "demographics": {
-            "population": int(data['population']),
-            "median_age": round(data.get('median_age', 0), 1),
-            "median_income": int(data.get('median_income', 0)),
-            "ethnicity": {
-                "white": round(data.get('white_pct', 0) * 100, 1),
-                "black": round(data.get('black_pct', 0) * 100, 1),
-                "hispanic": round(data.get('hispanic_pct', 0) * 100, 1),
-                "asian": round(data.get('asian_pct', 0) * 100, 1)
-            },
-            "education": {
-                "college_degree_pct": round(data.get('college_degree_pct', 0) * 100, 1)
-            }
-        }
-    })
+    try:
+        return [(column, bound, float(value) * scale) for column, bound, value, scale in terms]
+    except (TypeError, ValueError):
+        raise ValueError("Range filter bounds must be numbers")
 
-@app.route('/api/analysis/top-50-percent', methods=['POST'])
-def get_top_50_percent_zipcodes():
-    """
-    Get the top zip codes that make up 50% of the population
-    based on demographic filters.
+def compile_filters(engine, filters):
+    """Compile a filter spec into one boolean mask and one multiplier vector
+    over the engine's rows.
+
+    Target dimensions (``age``, ``ethnicity``, ``income``, ``gender``) take one
+    value or a list; values in a list are alternatives, so their bucket shares
+    are summed (capped at 1) into that dimension's multiplier. ``education``
+    takes a list of EDUCATION_THRESHOLDS keys, any of which admits a zip.
+    Numeric ranges come from FILTER_RANGE_KEYS and ``ranges``. Dimensions are
+    AND-ed: multipliers multiply in place and the mask is the AND of the
+    predicates' packed bitsets (``compile_filter_bitset``), unpacked once.
+    Unknown values and unknown range columns raise ValueError.
     """
-    global demographic_df, zip_coordinates_df
+    multiplier = np.ones(len(engine['population']), dtype=np.float64)
     
-    if demographic_df is None:
-        demographic_df = load_demographic_data()
+    for dimension in TARGET_PASSTHROUGH:
+        selected = target_filter_selection(dimension, filters.get(dimension))
+        if selected is None:
+            continue
+        
+        check_filter_values(dimension, selected, engine['bucket_index'])
+        positions = [engine['bucket_index'][(dimension, value)] for value in selected]
+        if len(positions) == 1:
+            multiplier *= engine['fractions'][:, positions[0]]
+        else:
+            share = engine['fractions'][:, positions].sum(axis=1, dtype=np.float64)
+            multiplier *= np.minimum(share, 1.0, out=share)
     
-    if zip_coordinates_df is None:
-        zip_coordinates_df = load_zip_coordinates()
+    mask = np.unpackbits(compile_filter_bitset(engine, filters), count=len(multiplier)).view(bool)
+    return {'mask': mask, 'multiplier': multiplier}
+
+def compile_filter_bitset(engine, filters, targets=False):
+    """Packed bitset of the rows passing a filter spec's education and range
+    predicates, AND-ed from the threshold indexes (range columns without an
+    index are scanned). With ``targets`` it also requires someone in a selected
+    bucket of every target dimension, i.e. a non-zero multiplier."""
+    df = engine['source']
+    bitsets = engine['bitsets']
+    bits = bitsets['all'].copy()
     
-    if demographic_df is None:
-        return jsonify({"error": "Demographic data not available"}), 500
+    if targets:
+        for dimension in TARGET_PASSTHROUGH:
+            selected = target_filter_selection(dimension, filters.get(dimension))
+            if selected is None:
+                continue
+            check_filter_values(dimension, selected, bitsets['buckets'])
+            admitted = np.zeros_like(bits)
+            for value in selected:
+                admitted |= bitsets['buckets'][(dimension, value)]
+            bits &= admitted
     
-    try:
-        data = request.get_json()
-        filters = data.get('filters', {})
-        
-        # Apply demographic filters
-        filtered_df = demographic_df.copy()
-        
-        # Age filter - map frontend values to actual column names
-        if 'age' in filters and filters['age']:
-            age_ranges = filters['age']
-            if 'under-20' in age_ranges:
-                # Combine under 10 and 10-19 age groups
-                filtered_df = filtered_df[(filtered_df['age_under_10'] > 0) | (filtered_df['age_10_to_19'] > 0)]
-            if '20-29' in age_ranges:
-                filtered_df = filtered_df[filtered_df['age_20s'] > 0]
-            if '30-39' in age_ranges:
-                filtered_df = filtered_df[filtered_df['age_30s'] > 0]
-            if '40-49' in age_ranges:
-                filtered_df = filtered_df[filtered_df['age_40s'] > 0]
-            if '50-59' in age_ranges:
-                filtered_df = filtered_df[filtered_df['age_50s'] > 0]
-            if '60+' in age_ranges:
-                # Combine 60s, 70s, and over 80
-                filtered_df = filtered_df[(filtered_df['age_60s'] > 0) | (filtered_df['age_70s'] > 0) | (filtered_df['age_over_80'] > 0)]
-        
-        # Income filter - map frontend values to actual column names
-        if 'income' in filters and filters['income']:
-            income_ranges = filters['income']
-            if 'under-50k' in income_ranges:
-                # Sum all income brackets under 50k
-                under_50k_cols = ['income_household_under_10k', 'income_household_10k_to_15k', 
-                                 'income_household_15k_to_20k', 'income_household_20k_to_25k', 
-                                 'income_household_25k_to_30k', 'income_household_30k_to_35k', 
-                                 'income_household_35k_to_40k', 'income_household_40k_to_45k', 
-                                 'income_household_45k_to_50k']
-                filtered_df = filtered_df[filtered_df[under_50k_cols].sum(axis=1) > 0]
-            if '50k-75k' in income_ranges:
-                filtered_df = filtered_df[(filtered_df['income_household_50k_to_60k'] > 0) | 
-                                         (filtered_df['income_household_60k_to_75k'] > 0)]
-            if '75k-100k' in income_ranges:
-                filtered_df = filtered_df[filtered_df['income_household_75k_to_100k'] > 0]
-            if '100k-125k' in income_ranges:
-                filtered_df = filtered_df[filtered_df['income_household_100k_to_125k'] > 0]
-            if '125k-150k' in income_ranges:
-                filtered_df = filtered_df[filtered_df['income_household_125k_to_150k'] > 0]
-            if '150k-200k' in income_ranges:
-                filtered_df = filtered_df[filtered_df['income_household_150k_to_200k'] > 0]
-            if 'over-200k' in income_ranges:
-                filtered_df = filtered_df[filtered_df['income_household_over_200k'] > 0]
-        
-        # Ethnicity filter - better approach using actual percentages
-        if 'ethnicity' in filters and filters['ethnicity']:
-            ethnicity_filters = filters['ethnicity']
-            
-            # Create a mask for zip codes that have ANY of the selected ethnicities
-            ethnicity_mask = pd.Series([False] * len(filtered_df), index=filtered_df.index)
-            
-            for ethnicity in ethnicity_filters:
-                if ethnicity == 'white-caucasian' and 'race_white' in filtered_df.columns:
-                    ethnicity_mask |= (filtered_df['race_white'] > 0)  # Any white population
-                elif ethnicity == 'black-african-american' and 'race_black' in filtered_df.columns:
-                    ethnicity_mask |= (filtered_df['race_black'] > 0)  # Any black population
-                elif ethnicity == 'hispanic' and 'hispanic' in filtered_df.columns:
-                    ethnicity_mask |= (filtered_df['hispanic'] > 0)  # Any hispanic population
-                elif ethnicity == 'asian' and 'race_asian' in filtered_df.columns:
-                    ethnicity_mask |= (filtered_df['race_asian'] > 0)  # Any asian population
-                # ... continue for other ethnicities
-            
-            # Apply the combined ethnicity filter
-            filtered_df = filtered_df[ethnicity_mask]
-        
-        # Education filter - map frontend values to actual column names
-        if 'education' in filters and filters['education']:
-            education_filters = filters['education']
-            if 'highschool' in education_filters and 'education_highschool' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['education_highschool'] >= 20]  # 20% threshold
-            if 'college' in education_filters and 'education_some_college' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['education_some_college'] >= 20]  # 20% threshold
-            if 'bachelors' in education_filters and 'education_bachelors' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['education_bachelors'] >= 20]  # 20% threshold
-            if 'graduate' in education_filters and 'education_graduate' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['education_graduate'] >= 10]  # 10% threshold
-        
-        # Calculate total population for filtered data
-        total_population = filtered_df['population'].sum()
-        
-        if total_population == 0:
-            return jsonify({"error": "No data matches the selected filters"}), 400
-        
-        # Sort by population and find top zip codes that make up 50%
-        sorted_df = filtered_df.sort_values('population', ascending=False)
-        cumulative_population = sorted_df['population'].cumsum()
-        fifty_percent_threshold = total_population * 0.5
-        
-        # Find zip codes that make up 50% of population
-        top_50_percent = sorted_df[cumulative_population <= fifty_percent_threshold]
-        
-        # Get top 20 zip codes for the data table
-        top_20 = sorted_df.head(20)
-        
-        # Add coordinates if available
-        if zip_coordinates_df is not None:
-            top_50_percent_with_coords = top_50_percent.merge(
-                zip_coordinates_df, on='zip_code', how='left'
-            )
-            top_20_with_coords = top_20.merge(
-                zip_coordinates_df, on='zip_code', how='left'
-            )
-        else:
-            top_50_percent_with_coords = top_50_percent
-            top_20_with_coords = top_20
+    education = filters.get('education')
+    if education:
+        selected = education if isinstance(education, (list, tuple)) else [education]
+        check_filter_values('education', selected, EDUCATION_THRESHOLDS)
+        admitted = np.zeros_like(bits)
+        for value in selected:
+            column, threshold = EDUCATION_THRESHOLDS[value]
+            if column in bitsets['columns']:
+                admitted |= threshold_bitset(bitsets, column, 'min', threshold)
+        bits &= admitted
+    
+    for column, bound, value in filter_range_bounds(filters):
+        column_bits = threshold_bitset(bitsets, column, bound, value)
+        if column_bits is None:
+            if column not in df.columns or column == 'zip_key' or not pd.api.types.is_numeric_dtype(df[column]):
+                raise ValueError(f"Unknown range filter column: {column}")
+            compare = np.greater_equal if bound == 'min' else np.less_equal
+            column_bits = np.packbits(compare(df[column].to_numpy(), value))
+        bits &= column_bits
+    
+    return bits
+
+def count_filter_matches(engine, filters):
+    """Matching zip count and their total population for a filter spec, from
+    the packed bitsets alone (no multiplier is computed)"""
+    bits = compile_filter_bitset(engine, filters, targets=True)
+    selected = np.unpackbits(bits, count=engine['bitsets']['row_count'])
+    return {
+        'matching_zip_codes': int(np.count_nonzero(selected)),
+        'total_population': int(np.dot(engine['population'], selected)),
+    }
+
+def compute_target_population(engine, filters):
+    """Target population per zip (aligned with demographic_df rows) for a
+    filter spec; zero where the spec's mask excludes the zip."""
+    compiled = compile_filters(engine, filters)
+    target_population = engine['population'] * compiled['multiplier']
+    target_population[~compiled['mask']] = 0
+    return target_population
+
+def filter_positions(engine, filters):
+    """Row positions of the zips a filter spec admits (mask set and a non-zero
+    multiplier), in dataset order"""
+    bits = compile_filter_bitset(engine, filters, targets=True)
+    return np.flatnonzero(np.unpackbits(bits, count=engine['bitsets']['row_count']))
+
+def top_k_positions(values, k):
+    """Positions of the ``k`` largest ``values``, largest first.
+
+    Uses argpartition to select the top ``k`` in O(n) and only sorts those,
+    instead of sorting every zip code.
+    """
+    k = max(0, min(int(k), len(values)))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < len(values):
+        candidates = np.argpartition(-values, k - 1)[:k]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.argsort(-values[candidates], kind='stable')]
+
+def cumulative_share_counts(values, shares, total=None):
+    """For each share, how many of the largest ``values`` it takes before their
+    running total exceeds that share of ``total`` (the 50%/80% counts).
+
+    One sort of the values and one cumsum pass; no sorted frame is built.
+    """
+    if total is None:
+        total = values.sum()
+    cumulative = np.cumsum(np.sort(values)[::-1])
+    return [int(np.searchsorted(cumulative, total * share, side='right')) for share in shares]
+
+def summarize_target_population(target_population, top_k):
+    """Rank a target-population vector into what the map/table responses need:
+    the top ``top_k`` positions and values plus whole-market totals."""
+    matching = np.flatnonzero(target_population > 0)
+    matching_target_population = target_population[matching]
+    total_target_population = matching_target_population.sum()
+
+    top_positions = matching[top_k_positions(matching_target_population, top_k)]
+    top_50_percent_count, top_80_percent_count = cumulative_share_counts(
+        matching_target_population, [0.5, 0.8], total=total_target_population
+    )
+
+    return {
+        'positions': top_positions,
+        'target_population': target_population[top_positions],
+        'total': float(total_target_population),
+        'matching_count': len(matching),
+        'top_50_percent_count': top_50_percent_count,
+        'top_80_percent_count': top_80_percent_count,
+    }
+
+def target_filter_values():
+    """Filter values per dimension in materialization order, passthrough first"""
+    return {
+        dimension: [passthrough] + list(TARGET_BUCKETS[dimension])
+        for dimension, passthrough in TARGET_PASSTHROUGH.items()
+    }
+
+def target_combination_index(filters):
+    """Row of a filter combination in the materialized rankings, or None if any
+    value is outside the precomputed filter space"""
+    if any(filters.get(key) for key in filters if key not in TARGET_PASSTHROUGH):
+        return None
+    
+    index = 0
+    for dimension, values in target_filter_values().items():
+        selected = target_filter_selection(dimension, filters.get(dimension)) or [TARGET_PASSTHROUGH[dimension]]
+        if len(selected) > 1 or selected[0] not in values:
+            return None
+        index = index * len(values) + values.index(selected[0])
+    return index
+
+def target_rankings_dtype(top_k):
+    return np.dtype([
+        ('positions', np.int32, (top_k,)),
+        ('target_population', np.float64, (top_k,)),
+        ('count', np.int32),
+        ('matching_count', np.int32),
+        ('top_50_percent_count', np.int32),
+        ('top_80_percent_count', np.int32),
+        ('total', np.float64),
+    ])
+
+def materialize_target_rankings(engine):
+    """Precompute the ranked result of every map/table filter combination.
+
+    Writes one fixed-size record per combination (top zip positions, their target
+    population and the whole-market totals) to a single .npy file that workers
+    open memory-mapped. A JSON sidecar records the dataset fingerprint it was
+    built from so stale rankings are never served.
+    """
+    values = target_filter_values()
+    dimensions = list(values)
+    combinations = list(itertools.product(*values.values()))
+
+    print(f"Materializing target rankings for {len(combinations)} filter combinations...")
+    start = time.perf_counter()
+
+    records = np.zeros(len(combinations), dtype=target_rankings_dtype(MATERIALIZED_TOP_K))
+    for i, combination in enumerate(combinations):
+        target_population = compute_target_population(engine, dict(zip(dimensions, combination)))
+        summary = summarize_target_population(target_population, MATERIALIZED_TOP_K)
+
+        count = len(summary['positions'])
+        record = records[i]
+        record['positions'][:count] = summary['positions']
+        record['target_population'][:count] = summary['target_population']
+        record['count'] = count
+        record['matching_count'] = summary['matching_count']
+        record['top_50_percent_count'] = summary['top_50_percent_count']
+        record['top_80_percent_count'] = summary['top_80_percent_count']
+        record['total'] = summary['total']
+
+    # Write to per-process temporary files and swap them in so readers never
+    # see a partial file. The rankings go first: the sidecar validates them, so
+    # it is only replaced once the rankings it describes are in place
+    tmp_path = f"{TARGET_RANKINGS_PATH}.tmp-{os.getpid()}"
+    tmp_meta_path = f"{TARGET_RANKINGS_META_PATH}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, records)
+        with open(tmp_meta_path, 'w') as f:
+            json.dump({'version': engine['version'], 'top_k': MATERIALIZED_TOP_K, 'values': values}, f)
+        os.replace(tmp_path, TARGET_RANKINGS_PATH)
+        os.replace(tmp_meta_path, TARGET_RANKINGS_META_PATH)
+    finally:
+        for path in (tmp_path, tmp_meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    print(f"Saved target rankings: {TARGET_RANKINGS_PATH} "
+          f"({records.nbytes / 1e6:.1f} MB in {time.perf_counter() - start:.1f}s)")
+
+def load_target_rankings(engine):
+    """Memory-map the materialized rankings.
+    
+    They are written by ``convert_excel_to_parquet``; when they are missing or
+    were built from other data (e.g. the parquet file predates them) they are
+    built here instead.
+    """
+    try:
+        if os.path.exists(TARGET_RANKINGS_META_PATH) and os.path.exists(TARGET_RANKINGS_PATH):
+            with open(TARGET_RANKINGS_META_PATH) as f:
+                meta = json.load(f)
+            if (meta.get('version') == engine['version']
+                    and meta.get('top_k') == MATERIALIZED_TOP_K
+                    and meta.get('values') == target_filter_values()):
+                print("Using existing target rankings")
+                return np.load(TARGET_RANKINGS_PATH, mmap_mode='r')
+
+        materialize_target_rankings(engine)
+        return np.load(TARGET_RANKINGS_PATH, mmap_mode='r')
+
+    except Exception as e:
+        # Rankings are an optimization; requests fall back to the engine
+        print(f"Error loading target rankings: {e}")
+        return None
+
+def get_target_ranking(engine, filters, top_k):
+    """Top ``top_k`` target-population ranking for the map/table filters.
+
+    Served as a slice of the materialized rankings when the combination was
+    precomputed, otherwise computed from the engine.
+    """
+    rankings = engine.get('rankings')
+    index = target_combination_index(filters) if rankings is not None else None
+
+    if index is None or top_k > MATERIALIZED_TOP_K:
+        target_population = compute_target_population(engine, filters)
+        return summarize_target_population(target_population, top_k)
+
+    record = rankings[index]
+    count = min(int(record['count']), top_k)
+    return {
+        'positions': np.asarray(record['positions'][:count]),
+        'target_population': np.asarray(record['target_population'][:count]),
+        'total': float(record['total']),
+        'matching_count': int(record['matching_count']),
+        'top_50_percent_count': int(record['top_50_percent_count']),
+        'top_80_percent_count': int(record['top_80_percent_count']),
+    }
+
+def take_text_column(df, name, rows, default='Unknown'):
+    """Column ``name`` of ``df`` at positions ``rows`` as a list of strings,
+    with ``default`` for missing values (or when the column doesn't exist).
+    Rows are taken before converting, so Arrow-backed text columns aren't
+    materialized whole."""
+    if name == 'zip_code' and name not in df.columns and 'zip_key' in df.columns:
+        return zip_code_strings(df['zip_key'].to_numpy()[rows])
+    if name not in df.columns:
+        return [default] * len(rows)
+    values = df[name].iloc[rows].to_numpy()
+    return np.where(pd.isna(values), default, values.astype(str)).tolist()
+
+def zip_demographics_columns(df):
+    """Rounded /api/demographics/zip fields for every row of ``df``, column-wise"""
+    def numeric(column):
+        if column not in df.columns:
+            return np.zeros(len(df), dtype=np.float64)
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+        return np.nan_to_num(values)
+
+    return {
+        'population': numeric('population').astype(np.int64),
+        'median_age': np.round(numeric('median_age'), 1),
+        'median_income': numeric('median_income').astype(np.int64),
+        'white': np.round(numeric('white_pct') * 100, 1),
+        'black': np.round(numeric('black_pct') * 100, 1),
+        'hispanic': np.round(numeric('hispanic_pct') * 100, 1),
+        'asian': np.round(numeric('asian_pct') * 100, 1),
+        'college_degree_pct': np.round(numeric('college_degree_pct') * 100, 1),
+    }
+
+def zip_demographics_payloads(zip_codes, columns):
+    """One /api/demographics/zip payload per entry of ``zip_codes``"""
+    values = {name: column.tolist() for name, column in columns.items()}
+    return [
+        {
+            "zip_code": zip_code,
+            "demographics": {
+                "population": population,
+                "median_age": median_age,
+                "median_income": median_income,
+                "ethnicity": {
+                    "white": white,
+                    "black": black,
+                    "hispanic": hispanic,
+                    "asian": asian
+                },
+                "education": {
+                    "college_degree_pct": college_degree_pct
+                }
+            }
+        }
+        for zip_code, population, median_age, median_income, white, black, hispanic, asian, college_degree_pct
+        in zip(zip_codes, values['population'], values['median_age'], values['median_income'],
+               values['white'], values['black'], values['hispanic'], values['asian'],
+               values['college_degree_pct'])
+    ]
+
+def build_zip_index(df):
+    """Hash index from zip code to row, plus the serialized response per zip.
+
+    Duplicate zip codes resolve to their first row, matching the previous
+    ``iloc[0]`` lookup. ``lookup`` is a ``pd.Index`` of the indexed zip codes
+    so a batch of zips is resolved with one ``get_indexer`` call; ``rows``
+    maps those lookup positions back to ``demographic_df`` rows.
+    """
+    zip_codes = pd.Series(take_text_column(df, 'zip_code', np.arange(len(df))))
+    first_rows = ~zip_codes.duplicated().to_numpy()
+    positions = np.flatnonzero(first_rows)
+    indexed_zip_codes = zip_codes.to_numpy()[positions]
+
+    columns = {name: column[positions]
+               for name, column in zip_demographics_columns(df).items()}
+    payloads = zip_demographics_payloads(indexed_zip_codes.tolist(), columns)
+    responses = {payload['zip_code']: app.json.dumps_bytes(payload) for payload in payloads}
+
+    print(f"Built zip index: {len(responses)} zip codes "
+          f"({sum(len(body) for body in responses.values()) / 1e6:.1f} MB of responses)")
+
+    return {
+        'lookup': pd.Index(indexed_zip_codes),
+        'rows': positions,
+        'columns': columns,
+        'responses': responses,
+    }
+
+def unit_vectors(latitudes, longitudes):
+    """Points on the unit sphere for latitude/longitude degrees, shape (n, 3)"""
+    lat = np.radians(latitudes)
+    lng = np.radians(longitudes)
+    return np.column_stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)])
+
+def chord_length(miles):
+    """Straight-line distance through the unit sphere for a great-circle distance"""
+    return 2 * np.sin(np.minimum(np.asarray(miles, dtype=np.float64) / EARTH_RADIUS_MILES, np.pi) / 2)
+
+def haversine_miles(latitude, longitude, latitudes, longitudes):
+    """Great-circle miles from one point to arrays of points"""
+    lat1, lng1 = np.radians(latitude), np.radians(longitude)
+    lat2, lng2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def build_spatial_index(df):
+    """Spatial index over the zip centroids of ``df``.
+
+    A cKDTree on unit-sphere coordinates answers radius queries (a great-circle
+    radius is a fixed chord length, so no projection distortion), and the
+    centroids sorted by latitude answer bounding boxes with one searchsorted
+    per edge. ``rows`` maps index positions back to ``demographic_df`` rows;
+    ``mercator`` and ``cells`` place every row on the Web Mercator plane and
+    the level-of-detail grid. Returns None when the data has no coordinates.
+    """
+    if 'latitude' not in df.columns or 'longitude' not in df.columns:
+        return None
+
+    latitudes = pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=np.float64)
+    longitudes = pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=np.float64)
+    rows = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+
+    by_latitude = rows[np.argsort(latitudes[rows], kind='stable')]
+
+    return {
+        'tree': cKDTree(unit_vectors(latitudes[rows], longitudes[rows])),
+        'rows': rows,
+        'latitude': latitudes,
+        'longitude': longitudes,
+        'by_latitude': by_latitude,
+        'sorted_latitudes': latitudes[by_latitude],
+        'mercator': mercator_xy(latitudes, longitudes),
+        'cells': build_lod_cells(latitudes, longitudes),
+    }
+
+def mercator_xy(latitudes, longitudes):
+    """Web Mercator coordinates scaled to [0, 1] (x east, y south)"""
+    lat = np.radians(np.clip(latitudes, -85.05112878, 85.05112878))
+    x = (np.asarray(longitudes, dtype=np.float64) + 180) / 360
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+def lod_grid_size(zoom):
+    """Grid cells along each axis of the world at ``zoom``"""
+    return (2 ** zoom) * LOD_CELLS_PER_TILE
+
+def build_lod_cells(latitudes, longitudes):
+    """Multi-resolution grid: for every zoom up to LOD_MAX_ZOOM, the id of the
+    Web Mercator cell holding each zip centroid (-1 without coordinates)"""
+    x, y = mercator_xy(latitudes, longitudes)
+    missing = np.isnan(x) | np.isnan(y)
+    x, y = np.nan_to_num(x), np.nan_to_num(y)
+
+    cells = []
+    for zoom in range(LOD_MAX_ZOOM + 1):
+        n = lod_grid_size(zoom)
+        cell_ids = np.floor(y * n).astype(np.int64) * n + np.floor(x * n).astype(np.int64)
+        cell_ids[missing] = -1
+        cells.append(cell_ids)
+    return cells
+
+def lod_cell_bounds(cell_ids, zoom):
+    """Latitude/longitude bounds of grid cells at ``zoom``"""
+    n = lod_grid_size(zoom)
+    cell_x, cell_y = cell_ids % n, cell_ids // n
+
+    def latitude(y):
+        return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+
+    return {
+        'south': latitude(cell_y + 1),
+        'west': cell_x / n * 360 - 180,
+        'north': latitude(cell_y),
+        'east': (cell_x + 1) / n * 360 - 180,
+    }
+
+def rows_within_radius(spatial_index, latitude, longitude, miles):
+    """``demographic_df`` rows within ``miles`` of a point and their distances,
+    nearest first"""
+    point = unit_vectors([latitude], [longitude])[0]
+    candidates = spatial_index['rows'][spatial_index['tree'].query_ball_point(point, chord_length(miles))]
+
+    distances = haversine_miles(latitude, longitude, spatial_index['latitude'][candidates],
+                                spatial_index['longitude'][candidates])
+    order = np.argsort(distances, kind='stable')
+    return candidates[order], distances[order]
+
+def rows_in_bbox(spatial_index, south, west, north, east):
+    """``demographic_df`` rows whose centroid lies in the bounding box.
+    A box with ``west > east`` crosses the antimeridian."""
+    sorted_latitudes = spatial_index['sorted_latitudes']
+    start = np.searchsorted(sorted_latitudes, south, side='left')
+    stop = np.searchsorted(sorted_latitudes, north, side='right')
+    rows = spatial_index['by_latitude'][start:stop]
+
+    longitudes = spatial_index['longitude'][rows]
+    if west <= east:
+        inside = (longitudes >= west) & (longitudes <= east)
+    else:
+        inside = (longitudes >= west) | (longitudes <= east)
+    return rows[inside]
+
+def build_cluster_features(df):
+    """Standardized clustering feature matrix for every row of ``df``.
+
+    Missing values are imputed with the column median so a sparse zip can't
+    break a fit. The scaler is fitted once on the whole dataset, so every
+    filtered subset is clustered in the same space and models fitted for one
+    filter set stay valid for prediction. ``version`` fingerprints the matrix
+    and names the persisted models.
+    """
+    features = [col for col in CLUSTER_FEATURES if col in df.columns]
+    X = np.column_stack([pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+                         for col in features])
+    medians = np.nan_to_num(np.nanmedian(X, axis=0))
+    X = np.where(np.isnan(X), medians, X)
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    return {
+        'features': features,
+        'X': X_scaled,
+        'version': hashlib.sha256(X_scaled.tobytes()).hexdigest()[:16],
+        'base_models': {},
+        'models': OrderedDict(),
+        'fitting': {},
+        'lock': threading.Lock(),
+    }
+
+def prune_cluster_models(clusters):
+    """Remove persisted models fitted on any other feature matrix version"""
+    if not os.path.isdir(CLUSTER_MODELS_DIR):
+        return
+    
+    removed = 0
+    for name in os.listdir(CLUSTER_MODELS_DIR):
+        if name.startswith(f"{clusters['version']}_"):
+            continue
+        try:
+            os.remove(os.path.join(CLUSTER_MODELS_DIR, name))
+            removed += 1
+        except OSError as e:
+            print(f"Error removing stale cluster model {name}: {e}")
+    if removed:
+        print(f"Removed {removed} stale cluster model files")
+
+def canonical_cluster_filters(filters):
+    """Canonical form of a clustering filter spec, used as its model signature.
+    
+    Every range bound (flat keys and ``ranges`` alike) becomes a
+    ``ranges`` term on its column, rounded to CLUSTER_SIGNATURE_DIGITS
+    significant digits; a bound given twice keeps the tighter value. Nearby
+    filter sets share one signature and so one fitted, persisted model.
+    """
+    ranges = {}
+    for column, bound, value in filter_range_bounds(filters):
+        value = float(f"{value:.{CLUSTER_SIGNATURE_DIGITS}g}")
+        current = ranges.setdefault(column, {}).get(bound)
+        if current is not None:
+            value = max(value, current) if bound == 'min' else min(value, current)
+        ranges[column][bound] = value
+    return {'ranges': ranges} if ranges else {}
+
+def cluster_model_path(clusters, key):
+    """Persisted model file for a filter signature of this feature matrix"""
+    return os.path.join(CLUSTER_MODELS_DIR, f"{clusters['version']}_{key[:16]}.joblib")
+
+def cached_cluster_model(clusters, filters, key):
+    """In-memory model for a signature, or None; caller holds ``clusters['lock']``"""
+    if not filters:
+        return clusters['base_models'].get(key)
+    model = clusters['models'].get(key)
+    if model is not None:
+        clusters['models'].move_to_end(key)
+    return model
+
+def get_cluster_model(clusters, filters, n_clusters, positions=None):
+    """MiniBatchKMeans model for a canonical filter signature
+    (``canonical_cluster_filters``), fitting it only once.
+
+    Models are looked up in memory, then on disk (joblib, keyed by the feature
+    matrix version and the signature). A new signature is fitted on
+    ``positions`` with MiniBatchKMeans, warm-started from the unfiltered
+    model's most populated centers (``warm_start_centers``) with a single
+    init, and persisted for other workers and restarts.
+    Unfiltered models stay in memory; filtered ones are kept in an LRU of
+    CLUSTER_MODEL_CACHE_SIZE. Fits run under a per-signature lock, so one
+    slow fit never blocks requests for other filter sets.
+    """
+    key = filter_cache_key('zip-clusters', {'filters': filters, 'n_clusters': n_clusters})
+    with clusters['lock']:
+        model = cached_cluster_model(clusters, filters, key)
+        if model is not None:
+            return model
+        key_lock = clusters['fitting'].setdefault(key, threading.Lock())
+
+    try:
+        with key_lock:
+            with clusters['lock']:
+                model = cached_cluster_model(clusters, filters, key)
+            if model is not None:
+                return model
+            
+            model = load_or_fit_cluster_model(clusters, filters, n_clusters, positions, key)
+            
+            with clusters['lock']:
+                if not filters:
+                    clusters['base_models'][key] = model
+                else:
+                    clusters['models'][key] = model
+                    while len(clusters['models']) > CLUSTER_MODEL_CACHE_SIZE:
+                        clusters['models'].popitem(last=False)
+            return model
+    finally:
+        with clusters['lock']:
+            clusters['fitting'].pop(key, None)
+
+def load_or_fit_cluster_model(clusters, filters, n_clusters, positions, key):
+    """Load the persisted model for a signature, or fit and persist it"""
+    path = cluster_model_path(clusters, key)
+    try:
+        if os.path.exists(path):
+            return joblib.load(path)
+    except Exception as e:
+        print(f"Error loading cluster model {path}: {e}")
+
+    X = clusters['X'] if positions is None else clusters['X'][positions]
+    base = None if not filters else get_base_cluster_model(clusters)
+
+    start = time.perf_counter()
+    if base is not None and n_clusters <= len(base.cluster_centers_):
+        model = MiniBatchKMeans(n_clusters=n_clusters, init=warm_start_centers(base, X, n_clusters),
+                                n_init=1, batch_size=4096, random_state=42)
+    else:
+        model = MiniBatchKMeans(n_clusters=n_clusters, n_init=3, batch_size=4096, random_state=42)
+    model.fit(X)
+    print(f"Fitted {n_clusters}-cluster model on {len(X)} zip codes "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    # Written to a per-process temporary file and swapped in, so concurrent
+    # workers never read a partial model
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(CLUSTER_MODELS_DIR, exist_ok=True)
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        # Persisting is an optimization; the in-memory model still serves
+        print(f"Error saving cluster model {path}: {e}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return model
+
+def get_base_cluster_model(clusters):
+    """The unfiltered MAX_CLUSTERS model used to warm-start filtered fits"""
+    key = filter_cache_key('zip-clusters', {'filters': {}, 'n_clusters': MAX_CLUSTERS})
+    with clusters['lock']:
+        return clusters['base_models'].get(key)
+
+def warm_start_centers(base, X, n_clusters):
+    """Initial centers for fitting ``n_clusters`` on the rows ``X``: the
+    unfiltered model's centers that the most of those rows fall into"""
+    centers = base.cluster_centers_
+    if n_clusters == len(centers):
+        return centers
+    counts = np.bincount(base.predict(X), minlength=len(centers))
+    return centers[np.argsort(-counts, kind='stable')[:n_clusters]]
+
+def build_lookalike_index(df):
+    """Standardized demographic profile of every zip for look-alike search.
+
+    Features are the age, income, race, education, hispanic and gender percent
+    columns plus median age and log median income, z-scored with missing values
+    at the column mean (0 after scaling). Rows are float32 with precomputed
+    squared norms, so distances to a query are one BLAS matrix-vector product.
+    """
+    features = [col for col in df.columns if is_percent_column(col)
+                and col not in ('white_pct', 'black_pct', 'hispanic_pct', 'asian_pct', 'college_degree_pct')]
+    features += [col for col in LOOKALIKE_EXTRA_FEATURES if col in df.columns]
+
+    X = np.column_stack([pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+                         for col in features])
+    if 'median_income' in features:
+        income = features.index('median_income')
+        X[:, income] = np.log1p(np.clip(X[:, income], 0, None))
+
+    mean = np.nanmean(X, axis=0)
+    std = np.nanstd(X, axis=0)
+    std[~(std > 0)] = 1.0
+    X = np.nan_to_num((X - np.nan_to_num(mean)) / std).astype(np.float32)
+
+    print(f"Built look-alike index: {X.shape[1]} features x {X.shape[0]} zip codes")
+
+    return {
+        'features': features,
+        'X': np.ascontiguousarray(X),
+        'squared_norms': np.einsum('ij,ij->i', X, X),
+    }
+
+def lookalike_distances(lookalike, seed_rows, combine='centroid'):
+    """Euclidean distance of every zip to the seeds' profile.
+
+    ``combine='centroid'`` measures distance to the mean seed profile;
+    ``'any'`` takes each zip's distance to its closest seed. Seeds are scored
+    LOOKALIKE_SEED_CHUNK at a time into a running minimum, so memory stays at
+    one zips x chunk block however many seeds there are.
+    """
+    X = lookalike['X']
+    queries = X[seed_rows]
+    if combine == 'centroid':
+        queries = queries.mean(axis=0, keepdims=True)
+
+    # |x - q|^2 = |x|^2 + |q|^2 - 2 x.q, with x.q for every zip in one matmul per chunk
+    closest = np.full(len(X), np.inf, dtype=X.dtype)
+    for start in range(0, len(queries), LOOKALIKE_SEED_CHUNK):
+        chunk = queries[start:start + LOOKALIKE_SEED_CHUNK]
+        squared = lookalike['squared_norms'][:, None] + np.einsum('ij,ij->i', chunk, chunk)[None, :]
+        squared -= 2 * (X @ chunk.T)
+        np.minimum(closest, squared.min(axis=1), out=closest)
+    return np.sqrt(np.clip(closest, 0, None))
+
+def parse_county_weights(fips_value, weights_value):
+    """(fips, weight) pairs for one zip's county lists, weights summing to 1.
+
+    ``county_weights`` is either a JSON object keyed by FIPS code or a
+    '|'-separated list aligned with ``county_fips_all``; missing or unreadable
+    weights are split evenly across the zip's counties.
+    """
+    fips_codes = [code.strip().split('.')[0].zfill(5) for code in str(fips_value).split('|')
+                  if code.strip() and code.strip().lower() != 'nan']
+    if not fips_codes:
+        return []
+    
+    weights_value = str(weights_value).strip()
+    try:
+        if weights_value.startswith('{'):
+            by_fips = {str(code).zfill(5): float(weight) for code, weight in json.loads(weights_value).items()}
+            weights = [by_fips.get(code, 0.0) for code in fips_codes]
+        else:
+            weights = [float(weight) for weight in weights_value.split('|')]
+            if len(weights) != len(fips_codes):
+                raise ValueError("weights don't line up with counties")
+    except (TypeError, ValueError):
+        weights = [1.0] * len(fips_codes)
+    
+    total = sum(weight for weight in weights if weight > 0)
+    if not total:
+        return [(code, 1 / len(fips_codes)) for code in fips_codes]
+    return [(code, weight / total) for code, weight in zip(fips_codes, weights) if weight > 0]
+
+def build_county_matrix(df):
+    """Sparse county x zip weight matrix from the county list columns.
+
+    Entry (c, z) is the share of zip z's population in county c, so a
+    per-zip vector rolls up to counties with one matrix-vector product.
+    Returns None when the frame has no county columns.
+    """
+    if 'county_fips_all' not in df.columns:
+        return None
+    
+    names = df['county_names_all'] if 'county_names_all' in df.columns else pd.Series('', index=df.index)
+    weights = df['county_weights'] if 'county_weights' in df.columns else pd.Series('', index=df.index)
+    
+    county_positions = {}
+    county_names = []
+    rows, columns, values = [], [], []
+    for zip_position, (fips_value, names_value, weights_value) in enumerate(
+            zip(df['county_fips_all'].tolist(), names.tolist(), weights.tolist())):
+        zip_names = str(names_value).split('|')
+        for i, (code, weight) in enumerate(parse_county_weights(fips_value, weights_value)):
+            if code not in county_positions:
+                county_positions[code] = len(county_names)
+                county_names.append(zip_names[i].strip() if i < len(zip_names) else code)
+            rows.append(county_positions[code])
+            columns.append(zip_position)
+            values.append(weight)
+    
+    matrix = sparse.csr_matrix((np.asarray(values, dtype=np.float64), (rows, columns)),
+                               shape=(len(county_names), len(df)))
+    return {'matrix': matrix, 'keys': np.array(list(county_positions), dtype=str), 'names': county_names}
+
+def save_county_matrix(county, zip_keys):
+    """Write the county matrix with the zip keys of its columns, swapped in
+    atomically; the keys let loaders detect a matrix built for other data"""
+    if county is None:
+        return
+    try:
+        matrix = county['matrix']
+        tmp_path = f"{COUNTY_MATRIX_PATH}.tmp-{os.getpid()}"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                         shape=np.array(matrix.shape), keys=county['keys'],
+                         names=np.array(county['names'], dtype=str), zip_keys=zip_keys)
+            os.replace(tmp_path, COUNTY_MATRIX_PATH)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        print(f"Saved county matrix: {COUNTY_MATRIX_PATH} ({matrix.shape[0]} counties, {matrix.nnz} zip weights)")
+    except Exception as e:
+        print(f"Error saving county matrix: {e}")
+
+def load_county_matrix(df):
+    """County matrix for ``df``: the saved one when it was built for the same
+    zips, otherwise parsed from the (lazily loaded) county columns and saved"""
+    zip_keys = df['zip_key'].to_numpy()
+    try:
+        if os.path.exists(COUNTY_MATRIX_PATH):
+            with np.load(COUNTY_MATRIX_PATH) as saved:
+                if np.array_equal(saved['zip_keys'], zip_keys):
+                    matrix = sparse.csr_matrix((saved['data'], saved['indices'], saved['indptr']),
+                                               shape=tuple(saved['shape']))
+                    return {'matrix': matrix, 'keys': saved['keys'], 'names': saved['names'].tolist()}
+    except Exception as e:
+        print(f"Error loading county matrix: {e}")
+    
+    county = build_county_matrix(attach_lazy_columns(df[['zip_key'] + [col for col in LAZY_COLUMNS if col in df.columns]]))
+    save_county_matrix(county, zip_keys)
+    return county
+
+def build_rollups(df, population):
+    """Group indexes for the state and county rollups.
+
+    Each level has a sparse group x zip weight ``matrix`` (0/1 for states,
+    population shares for counties), a 0/1 ``membership`` matrix for zip
+    counts, the group ``keys`` and ``names`` and the filter-independent
+    weighted ``population`` per group.
+    """
+    rollups = {}
+    
+    if 'state' in df.columns:
+        codes, states = pd.factorize(df['state'])
+        rows = np.flatnonzero(codes >= 0)
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (codes[rows], rows)), shape=(len(states), len(df)))
+        keys = np.asarray(states, dtype=str)
+        rollups['state'] = {'matrix': matrix, 'keys': keys, 'names': keys.tolist()}
+    
+    county = load_county_matrix(df)
+    if county is not None:
+        rollups['county'] = county
+    
+    for rollup in rollups.values():
+        membership = rollup['matrix'].copy()
+        membership.data[:] = 1
+        rollup['membership'] = membership
+        rollup['population'] = rollup['matrix'] @ population
+    
+    print("Built rollups: " + ", ".join(f"{len(rollup['keys'])} {level} groups" for level, rollup in rollups.items()))
+    return rollups
+
+class ResultCache:
+    """Bounded LRU cache of serialized JSON responses with a per-entry TTL.
+
+    Entries are evicted least-recently-used first once either ``max_entries`` or
+    ``max_bytes`` is exceeded, and expire ``ttl_seconds`` after being stored.
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl_seconds):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            body, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+
+            self._entries[key] = (body, time.monotonic() + self.ttl_seconds)
+            self._bytes += len(body)
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _discard(self, key):
+        body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
+
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 512)),
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    ttl_seconds=float(os.environ.get('RESULT_CACHE_TTL_SECONDS', 3600)),
+)
+
+# Map tiles are small and numerous, so they get their own budget instead of
+# evicting map/table responses
+tile_cache = ResultCache(
+    max_entries=int(os.environ.get('TILE_CACHE_MAX_ENTRIES', 20000)),
+    max_bytes=int(os.environ.get('TILE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    ttl_seconds=float(os.environ.get('RESULT_CACHE_TTL_SECONDS', 3600)),
+)
+
+def filter_cache_key(endpoint, params):
+    """Canonical hash of an endpoint and its request parameters"""
+    canonical = json.dumps({'endpoint': endpoint, 'params': params},
+                           sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def cached_response(endpoint, params, compute, mimetype='application/json', cache=None):
+    """Serve ``compute()`` through the result cache with ETag / If-None-Match.
+
+    ``compute`` returns ``(payload, status_code)`` where payload is JSON-able or
+    already-encoded bytes; only successful payloads are cached, in ``cache``
+    (``result_cache`` by default). The ETag combines the request key with the
+    dataset fingerprint, so a matching If-None-Match is answered with 304
+    before any work is done.
+    """
+    cache = result_cache if cache is None else cache
+    engine = get_target_engine()
+    key = filter_cache_key(endpoint, params)
+    etag = hashlib.sha256(f"{key}:{engine['version']}".encode('utf-8')).hexdigest()[:32]
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    body = cache.get(key)
+    if body is None:
+        payload, status_code = compute()
+        if status_code != 200:
+            return jsonify(payload), status_code
+
+        body = payload if isinstance(payload, bytes) else app.json.dumps_bytes(payload)
+        cache.put(key, body)
+
+    response = app.response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+class DemographicDataStore:
+    """Thread-safe, single-flight loader for the demographic data.
+
+    The first caller runs ``loader``; callers arriving while a load is in
+    flight block on the same lock and take its outcome instead of starting
+    their own Excel/parquet load. A failed load is retried by the next request.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self.state = 'not_loaded'
+        self.attempts = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.load_seconds = None
+        self.stage_seconds = {}
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def ensure_loaded(self):
+        """Load the data if needed; returns True once it is available"""
+        if self.state == 'ready':
+            return True
+
+        attempt = self.attempts
+        with self._lock:
+            # Only start a load if nobody finished one while we were waiting
+            if self.state != 'ready' and self.attempts == attempt:
+                self._load()
+            return self.state == 'ready'
+
+    def _load(self):
+        self.state = 'loading'
+        self.attempts += 1
+        self.error = None
+        self.started_at = time.time()
+        start = time.perf_counter()
+
+        try:
+            loaded, self.stage_seconds = self._loader()
+            self.state = 'ready' if loaded else 'failed'
+            if not loaded:
+                self.error = "Demographic data not available"
+        except Exception as e:
+            print(f"Error loading demographic data: {e}")
+            self.state = 'failed'
+            self.error = str(e)
+        finally:
+            self.load_seconds = round(time.perf_counter() - start, 3)
+            self.finished_at = time.time()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "attempts": self.attempts,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "load_seconds": self.load_seconds,
+            "stage_seconds": self.stage_seconds,
+        }
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/pricing')
+def pricing():
+    return render_template('pricing.html')
+
+@app.route('/tools')
+def tools():
+    return render_template('tools.html')
+
+@app.route('/api/health')
+def health_check():
+    return jsonify({"status": "healthy", "message": "Server is running"})
+
+@app.route('/api/ready')
+def readiness_check():
+    """Readiness probe: 200 once the dataset and target engine are loaded"""
+    if not data_store.ready:
+        return jsonify({"status": data_store.state, "message": "Demographic data not loaded yet"}), 503
+    
+    return jsonify({
+        "status": "ready",
+        "zip_codes": len(demographic_df),
+        "dataset_version": target_engine['version']
+    })
+
+@app.route('/api/demographics/zip/<zip_code>')
+def get_zip_demographics(zip_code):
+    """Get demographic data for a specific zip code"""
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    body = get_target_engine()['zip_index']['responses'].get(zip_code)
+    
+    if body is None:
+        return jsonify({"error": "Zip code not found"}), 404
+    
+    return app.response_class(body, mimetype='application/json')
+
+def normalize_zip_code(value):
+    """Five-digit zip string from CRM-style input (numbers, ZIP+4, whitespace)"""
+    zip_code = '' if value is None else str(value).strip().split('-')[0]
+    # CRM exports often carry zips as numbers, so restore the leading zeros
+    return zip_code.zfill(5) if zip_code else ''
+
+@app.route('/api/demographics/zips', methods=['POST'])
+def get_zip_demographics_batch():
+    """Get demographic data for a batch of zip codes in one vectorized lookup"""
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        zip_codes = data.get('zip_codes')
+        
+        if not isinstance(zip_codes, list):
+            return jsonify({"error": "zip_codes must be a list"}), 400
+        
+        if len(zip_codes) > MAX_BATCH_ZIP_CODES:
+            return jsonify({"error": f"At most {MAX_BATCH_ZIP_CODES} zip codes per request"}), 400
+        
+        requested = [normalize_zip_code(zip_code) for zip_code in zip_codes]
+        
+        zip_index = get_target_engine()['zip_index']
+        positions = zip_index['lookup'].get_indexer(requested)
+        found = positions >= 0
+        found_positions = positions[found]
+        
+        columns = {name: column[found_positions] for name, column in zip_index['columns'].items()}
+        found_zip_codes = [zip_code for zip_code, hit in zip(requested, found.tolist()) if hit]
+        
+        return jsonify({
+            "results": zip_demographics_payloads(found_zip_codes, columns),
+            "not_found": [zip_code for zip_code, hit in zip(requested, found.tolist()) if not hit],
+            "requested": len(requested),
+            "found": len(found_zip_codes)
+        })
+        
+    except Exception as e:
+        print(f"Error in batch zip lookup: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def target_filters_from_args():
+    """Map/table target filters (age, ethnicity, income, gender, education) from
+    the query string; a repeated or comma-separated parameter is a multi-select"""
+    filters = {}
+    for dimension in list(TARGET_PASSTHROUGH) + ['education']:
+        values = [value.strip() for raw in request.args.getlist(dimension)
+                  for value in raw.split(',') if value.strip()]
+        if values:
+            filters[dimension] = values if len(values) > 1 else values[0]
+    return filters
+
+def parse_customer_count(value):
+    """Customer count from an upload field, or None when missing or invalid"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+def first_field(names, candidates):
+    """Position (or key) of the first recognised field name, or None"""
+    for candidate in candidates:
+        if candidate in names:
+            return names.index(candidate) if isinstance(names, list) else candidate
+    return None
+
+def validate_upload_row(zip_value, count_value):
+    """Checked ``(zip_code, customer_count)`` of one upload row.
+
+    The zip must be a scalar (string or number); the count, when present, a
+    non-negative finite number, returned as a float. Raises ValueError otherwise.
+    """
+    if isinstance(zip_value, bool) or not isinstance(zip_value, (str, int, float, type(None))):
+        raise ValueError("zip code must be a string or number")
+    if count_value is None or count_value == '':
+        return zip_value, None
+    if isinstance(count_value, bool) or not isinstance(count_value, (str, int, float)):
+        raise ValueError("customer count must be a number")
+    try:
+        count = float(count_value)
+    except ValueError:
+        raise ValueError(f"customer count {count_value!r} is not a number")
+    if not np.isfinite(count) or count < 0:
+        raise ValueError(f"customer count must be a non-negative number, got {count_value!r}")
+    return zip_value, count
+
+def read_enrichment_upload(stream, input_format):
+    """Iterate ``(zip_code, customer_count, error)`` rows from a CSV or NDJSON upload.
+
+    The stream is decoded line by line, so the upload is never held in memory.
+    CSV needs a header row naming the zip column; NDJSON lines are objects
+    (or bare zip codes). Rows are checked with ``validate_upload_row``; a
+    malformed row has zip and count None and ``error`` set to a message naming
+    its line. Raises ValueError when the CSV header has no zip column.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    def checked_row(line_number, zip_value, count_value):
+        try:
+            return validate_upload_row(zip_value, count_value) + (None,)
+        except ValueError as e:
+            return None, None, f"Line {line_number}: {e}"
+
+    if input_format == 'csv':
+        reader = csv.reader(text)
+        header = [name.strip().lower() for name in next(reader, [])]
+        zip_position = first_field(header, ENRICHMENT_ZIP_FIELDS)
+        if zip_position is None:
+            raise ValueError(f"CSV header needs one of: {', '.join(ENRICHMENT_ZIP_FIELDS)}")
+        count_position = first_field(header, ENRICHMENT_COUNT_FIELDS)
+
+        return (
+            checked_row(reader.line_num,
+                        row[zip_position] if zip_position < len(row) else '',
+                        row[count_position] if count_position is not None and count_position < len(row) else None)
+            for row in reader if row
+        )
+
+    def ndjson_rows():
+        for line_number, line in enumerate(text, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield None, None, f"Line {line_number}: invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield checked_row(line_number, record, None)
+                continue
+            record = {str(key).lower(): value for key, value in record.items()}
+            zip_key = first_field(record, ENRICHMENT_ZIP_FIELDS)
+            count_key = first_field(record, ENRICHMENT_COUNT_FIELDS)
+            yield checked_row(line_number, record[zip_key] if zip_key else '',
+                              record[count_key] if count_key else None)
+
+    return ndjson_rows()
+
+def open_zip_upload():
+    """The uploaded zip list of the current request as ``(stream, input_format)``.
+
+    The upload is the raw request body or a multipart ``file`` field; its format
+    comes from ?input=, a ``.csv`` file name or the Content-Type. Raises
+    ValueError for an unsupported format.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        content_type = upload.mimetype
+        default_format = 'csv' if (upload.filename or '').lower().endswith('.csv') else None
+    else:
+        stream = request.stream
+        content_type = request.mimetype
+        default_format = None
+
+    input_format = request.args.get('input') or default_format or (
+        'csv' if content_type == 'text/csv' else 'ndjson')
+    if input_format not in ENRICHMENT_FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(ENRICHMENT_FORMATS)}")
+
+    return stream, input_format
+
+def enrich_zip_chunk(zip_index, rows, output_format):
+    """Join one chunk of upload rows against the zip index and encode it.
+
+    Uses the same rounded fields as /api/demographics/zip. NDJSON lines carry
+    the nested ``demographics`` payload; CSV flattens it into columns. Rows
+    the upload reader rejected are written with ``found`` false and their
+    ``error`` message, so they can't be mistaken for unknown zips.
+    """
+    requested = [normalize_zip_code(zip_code) for zip_code, _, _ in rows]
+    counts = [parse_customer_count(count) for _, count, _ in rows]
+    errors = [error for _, _, error in rows]
+
+    positions = zip_index['lookup'].get_indexer(requested)
+    found = (positions >= 0).tolist()
+    columns = {name: column[positions[positions >= 0]]
+               for name, column in zip_index['columns'].items()}
+
+    if output_format == 'csv':
+        values = iter(zip(*[column.tolist() for column in columns.values()]))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for zip_code, count, hit, error in zip(requested, counts, found, errors):
+            writer.writerow([zip_code, count, hit] + (list(next(values)) if hit else [''] * len(columns))
+                            + [error or ''])
+        return buffer.getvalue().encode('utf-8')
+
+    payloads = iter(zip_demographics_payloads([z for z, hit in zip(requested, found) if hit], columns))
+    lines = []
+    for zip_code, count, hit, error in zip(requested, counts, found, errors):
+        record = next(payloads) if hit else {"zip_code": zip_code, "demographics": None}
+        record["customer_count"] = count
+        record["found"] = hit
+        if error:
+            record["error"] = error
+        lines.append(app.json.dumps_bytes(record))
+    return b'\n'.join(lines) + b'\n'
+
+def enrichment_error_record(zip_index, message, output_format):
+    """Trailing record that ends an enrichment stream the upload broke off"""
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerow(
+            ['', '', False] + [''] * len(zip_index['columns']) + [message])
+        return buffer.getvalue().encode('utf-8')
+    return app.json.dumps_bytes({"error": message}) + b'\n'
+
+@app.route('/api/demographics/enrich', methods=['POST'])
+def enrich_zip_codes():
+    """
+    Stream demographics for a CSV or NDJSON list of zip codes.
+
+    The upload is the raw request body (or a multipart ``file`` field); its
+    format comes from ?input= or the Content-Type, and the response format from
+    ?format= (defaulting to the input format). Rows are joined and written back
+    in chunks of ENRICHMENT_CHUNK_ROWS. Malformed rows carry an ``error``; an
+    upload that can't be read any further (e.g. invalid UTF-8) is a 400 when
+    that happens in the first chunk, and otherwise ends the stream with an
+    ``error`` record.
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        stream, input_format = open_zip_upload()
+        output_format = request.args.get('format') or input_format
+        
+        if output_format not in ENRICHMENT_FORMATS:
+            return jsonify({"error": f"Format must be one of: {', '.join(ENRICHMENT_FORMATS)}"}), 400
+        
+        rows = read_enrichment_upload(stream, input_format)
+        
+        # Read the first chunk before responding, so an unreadable upload is
+        # still an error status rather than an empty 200
+        chunk = list(itertools.islice(rows, ENRICHMENT_CHUNK_ROWS))
+        
+    except (ValueError, csv.Error) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error starting zip enrichment: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    # Pin the index so a dataset reload mid-stream doesn't mix versions
+    zip_index = get_target_engine()['zip_index']
+    
+    def generate():
+        nonlocal chunk
+        if output_format == 'csv':
+            yield (','.join(['zip_code', 'customer_count', 'found'] + list(zip_index['columns']) + ['error'])
+                   + '\n').encode('utf-8')
+        while chunk:
+            yield enrich_zip_chunk(zip_index, chunk, output_format)
+            try:
+                chunk = list(itertools.islice(rows, ENRICHMENT_CHUNK_ROWS))
+            except Exception as e:
+                # The status is already sent; end with a record saying why
+                print(f"Error reading zip enrichment upload: {e}")
+                yield enrichment_error_record(zip_index, f"Upload could not be read: {e}", output_format)
+                return
+    
+    return app.response_class(stream_with_context(generate()),
+                              mimetype=ENRICHMENT_FORMATS[output_format])
+
+@app.route('/api/analysis/filter-count', methods=['POST'])
+def count_filtered_zip_codes():
+    """
+    Matching zip count and total population for a filter spec, for live
+    counters while filters are edited. Resolved entirely from the packed
+    filter bitsets, so it is cheap enough to call on every slider move.
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        filters = data.get('filters', {})
+        
+        response = count_filter_matches(get_target_engine(), filters)
+        response['filters'] = filters
+        return jsonify(response)
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Filter count failed: {str(e)}"}), 500
+
+@app.route('/api/analysis/top-50-percent', methods=['POST'])
+def get_top_50_percent_zipcodes():
+    """
+    Get the top zip codes that make up 50% of the population
+    based on demographic filters.
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        data = request.get_json()
+        filters = data.get('filters', {})
+        
+        # One mask over the whole dataset: selections within a dimension are
+        # alternatives, dimensions are combined with AND
+        engine = get_target_engine()
+        df = engine['source']
+        positions = filter_positions(engine, filters)
+        filtered_df = df.iloc[positions]
+        
+        # Calculate total population for filtered data
+        population = engine['population'][positions]
+        total_population = population.sum()
+        
+        if total_population == 0:
+            return jsonify({"error": "No data matches the selected filters"}), 400
+        
+        # Rank by population: count the zip codes that make up 50% with one
+        # cumsum pass, then partially select only the rows we return
+        top_50_percent_count, = cumulative_share_counts(population, [0.5])
+        
+        # Find zip codes that make up 50% of population
+        top_50_percent = filtered_df.iloc[top_k_positions(population, top_50_percent_count)]
+        
+        # Get top 20 zip codes for the data table
+        top_20 = filtered_df.iloc[top_k_positions(population, 20)]
+        
+        # Add coordinates if the demographic data doesn't already carry them
+        if 'latitude' not in filtered_df.columns and zip_coordinates_df is not None:
+            top_50_percent_with_coords = frame_columns(top_50_percent, ['zip_code', 'population', 'median_age', 'median_income']).merge(
+                zip_coordinates_df, on='zip_code', how='left'
+            )
+            top_20_with_coords = frame_columns(top_20, ['zip_code', 'population', 'median_age', 'median_income']).merge(
+                zip_coordinates_df, on='zip_code', how='left'
+            )
+        else:
+            top_50_percent_with_coords = top_50_percent
+            top_20_with_coords = top_20
         
         # Prepare response
         response = {
@@ -401,444 +2515,1183 @@ def get_top_50_percent_zipcodes():
             "top_50_percent": {
                 "zip_codes_count": len(top_50_percent),
                 "population_percentage": round(len(top_50_percent) / len(filtered_df) * 100, 1),
-                "zip_codes": top_50_percent_with_coords[['zip_code', 'population', 'median_age', 'median_income', 'latitude', 'longitude']].to_dict('records')
+                "zip_codes": json_records(frame_columns(top_50_percent_with_coords, ['zip_code', 'population', 'median_age', 'median_income', 'latitude', 'longitude']))
             },
-            "top_20": top_20_with_coords[['zip_code', 'population', 'median_age', 'median_income', 'latitude', 'longitude']].to_dict('records'),
+            "top_20": json_records(frame_columns(top_20_with_coords, ['zip_code', 'population', 'median_age', 'median_income', 'latitude', 'longitude'])),
             "demographic_summary": {
-                "avg_median_age": round(filtered_df['median_age'].mean(), 1) if 'median_age' in filtered_df.columns else 0,
+                "avg_median_age": round(float(filtered_df['median_age'].mean()), 1) if 'median_age' in filtered_df.columns else 0,
                 "avg_median_income": int(filtered_df['median_income'].mean()) if 'median_income' in filtered_df.columns else 0,
-                "avg_college_degree_pct": round(filtered_df['education_college_or_above'].mean(), 1) if 'education_college_or_above' in filtered_df.columns else 0
+                "avg_college_degree_pct": round(float(filtered_df['education_college_or_above'].astype('float64').mean()), 1) if 'education_college_or_above' in filtered_df.columns else 0
             }
         }
         
         return jsonify(response)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
 @app.route('/api/analysis/customer-concentration', methods=['POST'])
 def analyze_customer_concentration():
     """Analyze customer concentration based on demographic filters"""
-    global demographic_df
-    
-    if demographic_df is None:
-        demographic_df = load_demographic_data()
-    
-    if demographic_df is None:
+    if not data_store.ensure_loaded():
         return jsonify({"error": "Demographic data not available"}), 500
     
     try:
         data = request.get_json()
         filters = data.get('filters', {})
         
-        # Apply demographic filters
-        filtered_df = demographic_df.copy()
-        
-        # Age filter
-        if 'min_age' in filters and filters['min_age']:
-            filtered_df = filtered_df[filtered_df['median_age'] >= filters['min_age']]
-        
-        if 'max_age' in filters and filters['max_age']:
-            filtered_df = filtered_df[filtered_df['median_age'] <= filters['max_age']]
-        
-        # Income filter
-        if 'min_income' in filters and filters['min_income']:
-            filtered_df = filtered_df[filtered_df['median_income'] >= filters['min_income']]
-        
-        if 'max_income' in filters and filters['max_income']:
-            filtered_df = filtered_df[filtered_df['median_income'] <= filters['max_income']]
-        
-        # Ethnicity filter
-        if 'ethnicity' in filters and filters['ethnicity']:
-            ethnicity = filters['ethnicity'].lower()
-            if ethnicity == 'white':
-                filtered_df = filtered_df[filtered_df['white_pct'] >= 0.5]
-            elif ethnicity == 'black':
-                filtered_df = filtered_df[filtered_df['black_pct'] >= 0.3]
-            elif ethnicity == 'hispanic':
-                filtered_df = filtered_df[filtered_df['hispanic_pct'] >= 0.3]
-            elif ethnicity == 'asian':
-                filtered_df = filtered_df[filtered_df['asian_pct'] >= 0.15]
-        
-        # Education filter
-        if 'min_college_pct' in filters and filters['min_college_pct']:
-            filtered_df = filtered_df[filtered_df['college_degree_pct'] >= filters['min_college_pct'] / 100]
-        
-        # Population filter
-        if 'min_population' in filters and filters['min_population']:
-            filtered_df = filtered_df[filtered_df['population'] >= filters['min_population']]
+        # This form's ethnicity is a majority-style threshold rather than a
+        # target bucket: each selected ethnicity becomes a minimum on its share
+        # column, merged into the spec's ranges, and several are alternatives
+        spec = range_filter_spec(filters)
+        ethnicity = filters.get('ethnicity')
+        if isinstance(ethnicity, (list, tuple)):
+            ethnicity = [str(value).lower() for value in ethnicity]
+        elif ethnicity:
+            ethnicity = str(ethnicity).lower()
+        selected = target_filter_selection('ethnicity', ethnicity) or []
+        check_filter_values('ethnicity', selected, CONCENTRATION_ETHNICITY_THRESHOLDS)
+        
+        engine = get_target_engine()
+        if selected:
+            positions = np.unique(np.concatenate([
+                filter_positions(engine, merge_min_bound(spec, *CONCENTRATION_ETHNICITY_THRESHOLDS[value]))
+                for value in selected
+            ]))
+        else:
+            positions = filter_positions(engine, spec)
+        filtered_df = engine['source'].iloc[positions]
         
         # Calculate market size
-        total_population = filtered_df['population'].sum()
-        
-        # Sort by population to find top zip codes
-        top_zipcodes = filtered_df.nlargest(20, 'population')
+        population = engine['population'][positions]
+        total_population = population.sum()
         
-        # Calculate 80/20 analysis
-        sorted_by_pop = filtered_df.sort_values('population', ascending=False)
-        cumulative_pop = sorted_by_pop['population'].cumsum()
-        total_pop = sorted_by_pop['population'].sum()
+        # Rank by population to find top zip codes
+        top_zipcodes = filtered_df.iloc[top_k_positions(population, 20)]
         
-        # Find zip codes that make up 80% of population
-        eighty_percent_threshold = total_pop * 0.8
-        zipcodes_80_percent = sorted_by_pop[cumulative_pop <= eighty_percent_threshold]
+        # Calculate 80/20 analysis: zip codes that make up 80% of population
+        eighty_percent_count, = cumulative_share_counts(population, [0.8])
+        zipcodes_80_percent = filtered_df.iloc[top_k_positions(population, eighty_percent_count)]
         
         # Prepare response
         response = {
             "total_market_size": int(total_population),
             "total_zip_codes": len(filtered_df),
-            "top_zip_codes": top_zipcodes[['zip_code', 'population', 'median_age', 'median_income']].to_dict('records'),
+            "top_zip_codes": json_records(frame_columns(top_zipcodes, ['zip_code', 'population', 'median_age', 'median_income'])),
             "eighty_twenty_analysis": {
                 "zip_codes_count": len(zipcodes_80_percent),
                 "population_percentage": round(len(zipcodes_80_percent) / len(filtered_df) * 100, 1),
-                "zip_codes": zipcodes_80_percent[['zip_code', 'population']].to_dict('records')
+                "zip_codes": json_records(frame_columns(zipcodes_80_percent, ['zip_code', 'population']))
             },
             "demographic_summary": {
-                "avg_median_age": round(filtered_df['median_age'].mean(), 1),
+                "avg_median_age": round(float(filtered_df['median_age'].mean()), 1),
                 "avg_median_income": int(filtered_df['median_income'].mean()),
-                "avg_college_degree_pct": round(filtered_df['college_degree_pct'].mean() * 100, 1)
+                "avg_college_degree_pct": round(float(filtered_df['college_degree_pct'].astype('float64').mean()) * 100, 1)
             }
         }
         
         return jsonify(response)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
+@app.route('/api/analysis/market-share-curve', methods=['POST'])
+def get_market_share_curve():
+    """
+    Full market-share (Lorenz) curve of target population for a filter spec.
+    
+    Body: ``{"filters", "points", "percentiles"}``. Returns the curve sampled
+    at up to ``points`` zip counts (default CONCENTRATION_CURVE_POINTS), the
+    zip count needed for each percentile of the target population (default
+    50 and 80) and the Gini coefficient across matching zips. Cached per
+    filter set.
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        filters = data.get('filters', {})
+        points = int(request_float(data, 'points', 2, MAX_CURVE_POINTS, default=CONCENTRATION_CURVE_POINTS))
+        
+        percentiles = data.get('percentiles', MARKET_SHARE_PERCENTILES)
+        if not isinstance(percentiles, list) or len(percentiles) > MAX_CURVE_POINTS:
+            raise ValueError(f"percentiles must be a list of at most {MAX_CURVE_POINTS} numbers")
+        percentiles = [request_float({'percentile': value}, 'percentile', 0, 100) for value in percentiles]
+        
+        return cached_response(
+            'market-share-curve', {'filters': filters, 'points': points, 'percentiles': percentiles},
+            lambda: build_market_share_curve_response(filters, points, percentiles)
+        )
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Curve analysis failed: {str(e)}"}), 500
+
+def build_market_share_curve_response(filters, points, percentiles):
+    """Build the /api/analysis/market-share-curve payload. Returns (payload, status_code)."""
+    engine = get_target_engine()
+    target_population = compute_target_population(engine, filters)
+    
+    if not (target_population > 0).any():
+        return {"error": "No zip codes match the selected demographic criteria"}, 400
+    
+    curve = market_share_curve(target_population, points, percentiles)
+    return {
+        "filters": filters,
+        "total_target_population": int(curve['total']),
+        "matching_zip_codes": curve['matching_count'],
+        "gini": round(curve['gini'], 4),
+        "thresholds": curve['thresholds'],
+        "curve": curve['curve'],
+    }, 200
+
+def read_customer_chunks(stream, input_format):
+    """Iterate ``(zip_codes, counts)`` Series pairs from a customer upload.
+
+    CSV goes through pandas' C parser CUSTOMER_CHUNK_ROWS rows at a time;
+    NDJSON reuses the enrichment line reader. ``counts`` is NaN where a row
+    has no customer count. Raises ValueError, naming the line, when there is
+    no zip column or a row's zip or count is malformed (counts must be
+    non-negative finite numbers).
+    """
+    if input_format == 'csv':
+        recognised = ENRICHMENT_ZIP_FIELDS + ENRICHMENT_COUNT_FIELDS
+        reader = pd.read_csv(stream, dtype=str, chunksize=CUSTOMER_CHUNK_ROWS, encoding='utf-8-sig',
+                             usecols=lambda name: name.strip().lower() in recognised)
+        for chunk in reader:
+            header = [name.strip().lower() for name in chunk.columns]
+            zip_position = first_field(header, ENRICHMENT_ZIP_FIELDS)
+            if zip_position is None:
+                raise ValueError(f"CSV header needs one of: {', '.join(ENRICHMENT_ZIP_FIELDS)}")
+            count_position = first_field(header, ENRICHMENT_COUNT_FIELDS)
+
+            if count_position is None:
+                yield chunk.iloc[:, zip_position], pd.Series(np.nan, index=chunk.index)
+                continue
+            
+            raw = chunk.iloc[:, count_position]
+            counts = pd.to_numeric(raw, errors='coerce')
+            invalid = ((counts.isna() & (raw.fillna('').str.strip() != ''))
+                       | (counts < 0) | np.isinf(counts))
+            if invalid.any():
+                # The chunk index counts data rows from 0, after the header line
+                row = invalid.idxmax()
+                raise ValueError(f"Line {row + 2}: customer count must be a non-negative number, "
+                                 f"got {raw.loc[row]!r}")
+            yield chunk.iloc[:, zip_position], counts
+        return
+
+    rows = read_enrichment_upload(stream, input_format)
+    while True:
+        chunk = list(itertools.islice(rows, CUSTOMER_CHUNK_ROWS))
+        if not chunk:
+            return
+        zip_codes, counts, errors = zip(*chunk)
+        error = next((error for error in errors if error), None)
+        if error:
+            raise ValueError(error)
+        yield pd.Series(zip_codes, dtype=object), pd.Series(counts, dtype=np.float64)
+
+def aggregate_customer_counts(chunks, zip_index, row_count):
+    """Customers per ``demographic_df`` row from ``read_customer_chunks`` output.
+
+    Each chunk is folded in with one ``get_indexer`` plus ``np.bincount``, so
+    memory stays bounded by the chunk size. Rows without a count are one
+    customer each. Returns ``(customers, total_customers)``; the difference
+    between the total and ``customers.sum()`` are customers whose zip isn't in
+    the dataset.
+    """
+    customers = np.zeros(row_count, dtype=np.float64)
+    total_customers = 0.0
+
+    for zip_codes, counts in chunks:
+        counts = counts.fillna(1.0).to_numpy(dtype=np.float64)
+        total_customers += counts.sum()
+
+        # Normalize and look up each distinct zip once, then map rows through the codes
+        codes, distinct_zip_codes = pd.factorize(zip_codes)
+        positions = zip_index['lookup'].get_indexer([normalize_zip_code(zip_code) for zip_code in distinct_zip_codes])
+        positions = np.append(positions, -1)[codes]
+        found = positions >= 0
+        customers += np.bincount(zip_index['rows'][positions[found]], weights=counts[found],
+                                 minlength=row_count)
+
+    return customers, total_customers
+
+def safe_ratio(numerator, denominator):
+    """Element-wise ``numerator / denominator`` with 0 where the denominator is 0"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros(np.broadcast(numerator, denominator).shape),
+                     where=denominator > 0)
+
+def cumulative_share_curve(customers, population, points):
+    """Cumulative customer and population shares over zips ranked by customers.
+
+    Sampled at up to ``points`` evenly spaced zip counts (always including the
+    last zip with customers).
+    """
+    order = np.argsort(-customers, kind='stable')
+    order = order[customers[order] > 0]
+    if len(order) == 0:
+        return []
+
+    cumulative_customers = np.cumsum(customers[order])
+    cumulative_population = np.cumsum(population[order])
+    samples = np.unique(np.linspace(1, len(order), num=min(points, len(order))).round().astype(np.int64)) - 1
+
+    zip_share = np.round((samples + 1) / len(order) * 100, 2)
+    customer_share = np.round(safe_ratio(cumulative_customers[samples], customers.sum()) * 100, 2)
+    population_share = np.round(safe_ratio(cumulative_population[samples], population.sum()) * 100, 2)
+
+    return [
+        {"zip_count": int(count), "zip_share": zips, "customer_share": customer, "population_share": people}
+        for count, zips, customer, people in zip((samples + 1).tolist(), zip_share.tolist(),
+                                                 customer_share.tolist(), population_share.tolist())
+    ]
+
+def market_share_curve(values, points, percentiles):
+    """Concentration curve, percentile thresholds and Gini coefficient of the
+    positive ``values``, from one sort and one cumsum.
+
+    Zips are ranked largest first and the curve is sampled at up to ``points``
+    evenly spaced zip counts (always including the last zip). A threshold is
+    the number of top zips whose running total stays within that percentile of
+    the total, as in ``cumulative_share_counts``. The Gini coefficient is
+    ``(2 * sum(C) - 1) / n - 1`` over the top-k shares ``C``.
+    """
+    ranked = np.sort(values[values > 0])[::-1]
+    count = len(ranked)
+    cumulative = np.cumsum(ranked)
+    total = cumulative[-1]
+    
+    shares = cumulative / total
+    gini = (2 * shares.sum() - 1) / count - 1
+    
+    samples = np.unique(np.linspace(1, count, num=min(points, count)).round().astype(np.int64)) - 1
+    curve = [
+        {"zip_count": zip_count, "zip_share": zip_share, "population_share": population_share}
+        for zip_count, zip_share, population_share in zip(
+            (samples + 1).tolist(), np.round((samples + 1) / count * 100, 2).tolist(),
+            np.round(shares[samples] * 100, 2).tolist())
+    ]
+    
+    threshold_counts = np.searchsorted(cumulative, total * np.asarray(percentiles) / 100, side='right')
+    thresholds = [
+        {"percentile": percentile, "zip_count": int(zip_count), "zip_share": round(zip_count / count * 100, 2)}
+        for percentile, zip_count in zip(percentiles, threshold_counts.tolist())
+    ]
+    
+    return {
+        "total": float(total),
+        "matching_count": count,
+        "gini": float(gini),
+        "curve": curve,
+        "thresholds": thresholds,
+    }
+
+@app.route('/api/analysis/customer-penetration', methods=['POST'])
+def analyze_customer_penetration():
+    """
+    Penetration of an uploaded customer file per zip code.
+
+    The upload is a CSV or NDJSON list of customer zips, one row per customer
+    or with a ``customer_count`` column (same formats as /api/demographics/enrich).
+    Optional ?age=, ?ethnicity=, ?income= and ?gender= select the target
+    population; ?limit= caps the number of zip codes returned (default 100).
+    Penetration is customers per 1,000 residents and the index is a zip's
+    penetration relative to the footprint-wide rate (100 = average).
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        limit = max(0, int(request.args.get('limit', 100)))
+        filters = target_filters_from_args()
+        
+        stream, input_format = open_zip_upload()
+        chunks = read_customer_chunks(stream, input_format)
+        
+        engine = get_target_engine()
+        df = engine['source']
+        customers, total_customers = aggregate_customer_counts(chunks, engine['zip_index'], len(df))
+        
+        population = engine['population']
+        target_population = compute_target_population(engine, filters)
+        matched_customers = customers.sum()
+        
+        # Footprint-wide rates the per-zip index is measured against
+        national_penetration = safe_ratio(matched_customers, population.sum()) * 1000
+        national_target_penetration = safe_ratio(matched_customers, target_population.sum()) * 1000
+        
+        penetration = safe_ratio(customers, population) * 1000
+        target_penetration = safe_ratio(customers, target_population) * 1000
+        index = safe_ratio(penetration, national_penetration) * 100
+        target_index = safe_ratio(target_penetration, national_target_penetration) * 100
+        
+        top_positions = top_k_positions(customers, min(limit, int(np.count_nonzero(customers))))
+        top_50_count, top_80_count = cumulative_share_counts(customers, [0.5, 0.8])
+        
+        zip_codes = [
+            {
+                "zip_code": zip_code,
+                "state": state,
+                "city": city,
+                "customers": int(customer_count),
+                "population": int(zip_population),
+                "target_population": int(zip_target_population),
+                "penetration_per_1000": round(zip_penetration, 2),
+                "index": round(relative_index, 1),
+                "target_penetration_per_1000": round(zip_target_penetration, 2),
+                "target_index": round(zip_target_index, 1)
+            }
+            for zip_code, state, city, customer_count, zip_population, zip_target_population,
+                zip_penetration, relative_index, zip_target_penetration, zip_target_index
+            in zip(take_text_column(df, 'zip_code', top_positions), take_text_column(df, 'state', top_positions),
+                   take_text_column(df, 'city', top_positions), customers[top_positions].tolist(), population[top_positions].tolist(),
+                   target_population[top_positions].tolist(), penetration[top_positions].tolist(),
+                   index[top_positions].tolist(), target_penetration[top_positions].tolist(),
+                   target_index[top_positions].tolist())
+        ]
+        
+        return jsonify({
+            "filters": filters,
+            "summary": {
+                "total_customers": int(total_customers),
+                "matched_customers": int(matched_customers),
+                "unmatched_customers": int(total_customers - matched_customers),
+                "zip_codes_with_customers": int(np.count_nonzero(customers)),
+                "total_population": int(population.sum()),
+                "target_population": int(target_population.sum()),
+                "penetration_per_1000": round(float(national_penetration), 3),
+                "target_penetration_per_1000": round(float(national_target_penetration), 3),
+                "top_50_percent_zip_count": top_50_count,
+                "top_80_percent_zip_count": top_80_count
+            },
+            "zip_codes": zip_codes,
+            "cumulative_curve": cumulative_share_curve(customers, population, CONCENTRATION_CURVE_POINTS)
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in customer penetration analysis: {e}")
+        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+
+@app.route('/api/analysis/lookalikes', methods=['POST'])
+def find_lookalike_zip_codes():
+    """
+    Find the zip codes whose demographic profile is closest to seed zip codes.
+    
+    Body: ``{"zip_codes": [...], "k": 50, "combine": "centroid" | "any",
+    "include_seeds": false}``. Distances are Euclidean in the standardized
+    profile space of ``build_lookalike_index``; smaller is more alike.
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        seeds = data.get('zip_codes')
+        k = int(data.get('k', 50))
+        combine = data.get('combine', 'centroid')
+        include_seeds = bool(data.get('include_seeds', False))
+        
+        if not isinstance(seeds, list) or not seeds:
+            return jsonify({"error": "zip_codes must be a non-empty list"}), 400
+        if len(seeds) > MAX_LOOKALIKE_SEEDS:
+            return jsonify({"error": f"At most {MAX_LOOKALIKE_SEEDS} seed zip codes per request"}), 400
+        if not 1 <= k <= MAX_LOOKALIKES:
+            return jsonify({"error": f"k must be between 1 and {MAX_LOOKALIKES}"}), 400
+        if combine not in ('centroid', 'any'):
+            return jsonify({"error": "combine must be 'centroid' or 'any'"}), 400
+        
+        engine = get_target_engine()
+        df = engine['source']
+        zip_index = engine['zip_index']
+        
+        requested = [normalize_zip_code(zip_code) for zip_code in seeds]
+        positions = zip_index['lookup'].get_indexer(requested)
+        not_found = [zip_code for zip_code, position in zip(requested, positions.tolist()) if position < 0]
+        seed_rows = np.unique(zip_index['rows'][positions[positions >= 0]])
+        
+        if len(seed_rows) == 0:
+            return jsonify({"error": "None of the seed zip codes were found", "not_found": not_found}), 404
+        
+        distances = lookalike_distances(engine['lookalike'], seed_rows, combine)
+        candidates = distances.copy()
+        if not include_seeds:
+            candidates[seed_rows] = np.inf
+        
+        rows = top_k_positions(-candidates, k)
+        rows = rows[np.isfinite(candidates[rows])]
+        
+        columns = zip_demographics_columns(df[[col for col in ['population', 'median_age', 'median_income']
+                                               if col in df.columns]].iloc[rows])
+        lookalikes = [
+            {
+                "zip_code": zip_code,
+                "state": state,
+                "city": city,
+                "distance": round(distance, 4),
+                "population": population,
+                "median_age": median_age,
+                "median_income": median_income
+            }
+            for zip_code, state, city, distance, population, median_age, median_income in zip(
+                take_text_column(df, 'zip_code', rows), take_text_column(df, 'state', rows),
+                take_text_column(df, 'city', rows), distances[rows].tolist(),
+                columns['population'].tolist(), columns['median_age'].tolist(),
+                columns['median_income'].tolist())
+        ]
+        
+        return jsonify({
+            "seeds": take_text_column(df, 'zip_code', seed_rows),
+            "not_found": not_found,
+            "combine": combine,
+            "features": engine['lookalike']['features'],
+            "lookalikes": lookalikes
+        })
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in look-alike search: {e}")
+        return jsonify({"error": f"Look-alike search failed: {str(e)}"}), 500
+
+@app.route('/api/analysis/rollup/<level>', methods=['POST'])
+def get_geographic_rollup(level):
+    """
+    Target population aggregated by state or county for a filter spec.
+    
+    Body: ``{"filters", "limit"}``. Zips split across counties contribute to
+    each by their county weight. Groups are ranked by target population;
+    ``limit`` caps how many are returned (default: all).
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    if level not in ROLLUP_LEVELS:
+        return jsonify({"error": f"Level must be one of: {', '.join(ROLLUP_LEVELS)}"}), 400
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        filters = data.get('filters', {})
+        limit = data.get('limit')
+        limit = None if limit is None else max(1, int(limit))
+        
+        return cached_response(
+            'rollup', {'level': level, 'filters': filters, 'limit': limit},
+            lambda: build_geographic_rollup_response(level, filters, limit)
+        )
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Rollup failed: {str(e)}"}), 500
+
+def build_geographic_rollup_response(level, filters, limit):
+    """Build the /api/analysis/rollup payload with sparse matrix-vector
+    products over the precomputed group matrices. Returns (payload, status_code)."""
+    engine = get_target_engine()
+    rollup = engine['rollups'].get(level)
+    if rollup is None:
+        return {"error": f"No {level} data available"}, 400
+    
+    target_population = compute_target_population(engine, filters)
+    group_target = rollup['matrix'] @ target_population
+    group_zip_counts = rollup['membership'] @ (target_population > 0).astype(np.float64)
+    
+    order = top_k_positions(group_target, len(group_target) if limit is None else limit)
+    order = order[group_target[order] > 0]
+    target_share = safe_ratio(group_target[order], rollup['population'][order]) * 100
+    
+    groups = [
+        {"key": key, "name": name, "zip_codes": int(zip_count), "population": int(round(population)),
+         "target_population": int(round(target)), "target_share": round(share, 2)}
+        for key, name, zip_count, population, target, share in zip(
+            rollup['keys'][order].tolist(), [rollup['names'][i] for i in order],
+            group_zip_counts[order].tolist(), rollup['population'][order].tolist(),
+            group_target[order].tolist(), target_share.tolist())
+    ]
+    
+    return {
+        "level": level,
+        "filters": filters,
+        "total_target_population": int(round(target_population.sum())),
+        "total_groups": int(np.count_nonzero(group_target > 0)),
+        "groups": groups,
+    }, 200
+
 @app.route('/api/analysis/zip-clusters', methods=['POST'])
 def analyze_zip_clusters():
     """Analyze zip codes using clustering to find similar markets"""
-    global demographic_df
-    
-    if demographic_df is None:
-        demographic_df = load_demographic_data()
-    
-    if demographic_df is None:
+    if not data_store.ensure_loaded():
         return jsonify({"error": "Demographic data not available"}), 500
     
     try:
         data = request.get_json()
         filters = data.get('filters', {})
         
-        # Apply filters first
-        filtered_df = demographic_df.copy()
-        
-        # Apply same filters as customer concentration analysis
-        if 'min_age' in filters and filters['min_age']:
-            filtered_df = filtered_df[filtered_df['median_age'] >= filters['min_age']]
+        # Numeric range filters, as in customer concentration analysis
+        filters = range_filter_spec(filters)
         
-        if 'max_age' in filters and filters['max_age']:
-            filtered_df = filtered_df[filtered_df['median_age'] <= filters['max_age']]
+        return cached_response('zip-clusters', {'filters': filters},
+                               lambda: build_zip_clusters_response(filters))
         
-        if 'min_income' in filters and filters['min_income']:
-            filtered_df = filtered_df[filtered_df['median_income'] >= filters['min_income']]
-        
-        if 'max_income' in filters and filters['max_income']:
-            filtered_df = filtered_df[filtered_df['median_income'] <= filters['max_income']]
-        
-        # Prepare features for clustering
-        features = ['median_age', 'median_income', 'college_degree_pct']
-        X = filtered_df[features].values
-        
-        # Standardize features
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        
-        # Perform clustering
-        n_clusters = min(5, len(filtered_df) // 10)  # Adaptive number of clusters
-        if n_clusters < 2:
-            n_clusters = 2
-        
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        cluster_labels = kmeans.fit_predict(X_scaled)
-        
-        # Add cluster labels to dataframe
-        filtered_df['cluster'] = cluster_labels
-        
-        # Analyze clusters
-        clusters_analysis = []
-        for cluster_id in range(n_clusters):
-            cluster_data = filtered_df[filtered_df['cluster'] == cluster_id]
-            
-            cluster_info = {
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Clustering analysis failed: {str(e)}"}), 500
+
+def build_zip_clusters_response(filters):
+    """Cluster the zip codes matching ``filters`` with the persisted model for
+    that filter set; rows are assigned with ``predict``. Returns (payload, status_code)."""
+    engine = get_target_engine()
+    df = engine['source']
+    positions = filter_positions(engine, filters)
+    
+    # Adaptive number of clusters
+    n_clusters = max(2, min(MAX_CLUSTERS, len(positions) // 10))
+    if len(positions) < n_clusters:
+        return {"error": "Not enough zip codes match the filters to cluster"}, 400
+    
+    # Nearby filter sets share the model fitted on their canonical signature;
+    # its rows stand in unless rounding leaves too few of them to fit
+    signature = canonical_cluster_filters(filters)
+    fit_positions = filter_positions(engine, signature)
+    if len(fit_positions) < n_clusters:
+        fit_positions = positions
+    model = get_cluster_model(engine['clusters'], signature, n_clusters, fit_positions)
+    cluster_labels = model.predict(engine['clusters']['X'][positions])
+    
+    filtered_df = frame_columns(df.iloc[positions], ['zip_code', 'population', 'median_age', 'median_income', 'college_degree_pct'])
+    filtered_df = filtered_df.astype({'college_degree_pct': 'float64'})
+    grouped = filtered_df.groupby(cluster_labels)
+    means = grouped[['population', 'median_age', 'median_income', 'college_degree_pct']].mean()
+    counts = grouped.size()
+    zip_codes = filtered_df['zip_code'].to_numpy()
+    
+    # Analyze clusters
+    clusters_analysis = []
+    for cluster_id in range(n_clusters):
+        if cluster_id not in counts.index:
+            clusters_analysis.append({
                 "cluster_id": cluster_id,
-                "zip_codes_count": len(cluster_data),
-                "avg_population": int(cluster_data['population'].mean()),
-                "demographics": {
-                    "avg_median_age": round(cluster_data['median_age'].mean(), 1),
-                    "avg_median_income": int(cluster_data['median_income'].mean()),
-                    "avg_college_degree_pct": round(cluster_data['college_degree_pct'].mean() * 100, 1)
-                },
-                "sample_zip_codes": cluster_data['zip_code'].head(5).tolist()
-            }
-            
-            clusters_analysis.append(cluster_info)
-        
-        return jsonify({
-            "total_clusters": n_clusters,
-            "clusters": clusters_analysis,
-            "total_zip_codes": len(filtered_df)
+                "zip_codes_count": 0,
+                "avg_population": 0,
+                "demographics": {"avg_median_age": None, "avg_median_income": None, "avg_college_degree_pct": None},
+                "sample_zip_codes": []
+            })
+            continue
+        
+        cluster_means = means.loc[cluster_id]
+        clusters_analysis.append({
+            "cluster_id": cluster_id,
+            "zip_codes_count": int(counts.loc[cluster_id]),
+            "avg_population": int(cluster_means['population']),
+            "demographics": {
+                "avg_median_age": round(float(cluster_means['median_age']), 1),
+                "avg_median_income": int(cluster_means['median_income']),
+                "avg_college_degree_pct": round(float(cluster_means['college_degree_pct']) * 100, 1)
+            },
+            "sample_zip_codes": zip_codes[cluster_labels == cluster_id][:5].tolist()
         })
+    
+    return {
+        "total_clusters": n_clusters,
+        "clusters": clusters_analysis,
+        "total_zip_codes": len(positions)
+    }, 200
+
+def export_columns(df, requested=None):
+    """Columns to export: ``requested`` in order, or every column by default.
+    Raises ValueError for names that aren't exportable."""
+    available = [col for col in df.columns if col != 'zip_key']
+    if 'zip_code' not in df.columns and 'zip_key' in df.columns:
+        # zip_code is formatted from the key, in the key's place
+        available.insert(list(df.columns).index('zip_key'), 'zip_code')
+    if lazy_columns_source is not None:
+        available += [col for col in LAZY_COLUMNS if col not in available]
+    
+    if not requested:
+        return available
+    
+    unknown = [col for col in requested if col not in available]
+    if unknown:
+        raise ValueError(f"Unknown export columns: {', '.join(map(str, unknown))}")
+    return list(dict.fromkeys(requested))
+
+def widen_float32_columns(frame):
+    """``frame`` with its float32 columns widened to float64 and trimmed to the
+    digits float32 can represent, so no float32 noise reaches JSON or exports"""
+    float32_columns = frame.select_dtypes('float32').columns
+    if len(float32_columns):
+        frame = frame.copy()
+        frame[float32_columns] = frame[float32_columns].astype('float64').round(4)
+    return frame
+
+def json_records(frame):
+    """``frame.to_dict('records')`` with float32 columns widened first"""
+    return widen_float32_columns(frame).to_dict('records')
+
+def format_export_chunk(df, positions, columns):
+    """Rows ``positions`` of ``df`` restricted to ``columns``, in export units"""
+    eager = [col for col in columns if col in df.columns or col == 'zip_code']
+    chunk = widen_float32_columns(attach_lazy_columns(frame_columns(df.iloc[positions], eager))[columns])
+    
+    # Convert percentages to readable format
+    for col in ['white_pct', 'black_pct', 'hispanic_pct', 'asian_pct', 'college_degree_pct']:
+        if col in chunk.columns:
+            chunk[col] = (chunk[col] * 100).round(1)
+    
+    # Round numeric columns
+    if 'median_age' in chunk.columns:
+        chunk['median_age'] = chunk['median_age'].round(1)
+    if 'median_income' in chunk.columns:
+        chunk['median_income'] = chunk['median_income'].round(0)
+    
+    return chunk
+
+class ExportSink:
+    """Write-only file object that hands back whatever was written since the
+    last ``drain()``, so pyarrow writers can be streamed chunk by chunk."""
+    
+    def __init__(self):
+        self._buffers = []
+        self._position = 0
+        self.closed = False
+    
+    def write(self, data):
+        data = bytes(data)
+        self._buffers.append(data)
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self._position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def drain(self):
+        data = b''.join(self._buffers)
+        self._buffers = []
+        return data
+
+def export_arrow_schema(chunk):
+    """Arrow schema for an export, taking all-null columns as strings"""
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+def stream_export(df, positions, columns, export_format, compression):
+    """Yield the export file for ``positions`` in EXPORT_CHUNK_ROWS pieces.
+
+    CSV chunks are compressed with a streaming gzip encoder or as consecutive
+    zstd frames. Parquet writes one row group per chunk and Arrow an IPC
+    stream, both using their own internal compression.
+    """
+    chunks = (format_export_chunk(df, positions[start:start + EXPORT_CHUNK_ROWS], columns)
+              for start in range(0, max(len(positions), 1), EXPORT_CHUNK_ROWS))
+    
+    if export_format == 'csv':
+        if compression == 'gzip':
+            encoder = zlib.compressobj(wbits=31)
+            encode, finish = encoder.compress, encoder.flush
+        elif compression == 'zstd':
+            codec = pa.Codec('zstd')
+            encode, finish = lambda data: codec.compress(data, asbytes=True), lambda: b''
+        else:
+            encode, finish = lambda data: data, lambda: b''
         
-    except Exception as e:
-        return jsonify({"error": f"Clustering analysis failed: {str(e)}"}), 500
+        for i, chunk in enumerate(chunks):
+            yield encode(chunk.to_csv(index=False, header=(i == 0)).encode('utf-8'))
+        yield finish()
+        return
+    
+    sink = ExportSink()
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            schema = export_arrow_schema(chunk)
+            if export_format == 'parquet':
+                writer = pq.ParquetWriter(sink, schema, compression=compression or 'snappy')
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=compression)
+                writer = pa.ipc.new_stream(sink, schema, options=options)
+        
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield sink.drain()
+    
+    writer.close()
+    yield sink.drain()
 
 @app.route('/api/export/zip-data', methods=['POST'])
 def export_zip_data():
-    """Export filtered zip code data"""
-    global demographic_df
-    
-    if demographic_df is None:
-        demographic_df = load_demographic_data()
+    """
+    Export filtered zip code data.
     
-    if demographic_df is None:
+    ``format`` (body or query string) selects ``json`` (the default, a single
+    response) or a streamed ``csv``, ``parquet`` or ``arrow`` file; ``columns``
+    limits the exported columns and ``compression`` may be ``gzip`` or
+    ``zstd`` (Arrow supports only ``zstd``).
+    """
+    if not data_store.ensure_loaded():
         return jsonify({"error": "Demographic data not available"}), 500
     
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         filters = data.get('filters', {})
-        
-        # Apply filters
-        filtered_df = demographic_df.copy()
-        
-        # Apply same filters as before
-        if 'min_age' in filters and filters['min_age']:
-            filtered_df = filtered_df[filtered_df['median_age'] >= filters['min_age']]
-        
-        if 'max_age' in filters and filters['max_age']:
-            filtered_df = filtered_df[filtered_df['median_age'] <= filters['max_age']]
-        
-        if 'min_income' in filters and filters['min_income']:
-            filtered_df = filtered_df[filtered_df['median_income'] >= filters['min_income']]
-        
-        if 'max_income' in filters and filters['max_income']:
-            filtered_df = filtered_df[filtered_df['median_income'] <= filters['max_income']]
-        
-        # Prepare export data
-        export_data = filtered_df.copy()
-        
-        # Convert percentages to readable format
-        export_data['white_pct'] = (export_data['white_pct'] * 100).round(1)
-        export_data['black_pct'] = (export_data['black_pct'] * 100).round(1)
-        export_data['hispanic_pct'] = (export_data['hispanic_pct'] * 100).round(1)
-        export_data['asian_pct'] = (export_data['asian_pct'] * 100).round(1)
-        export_data['college_degree_pct'] = (export_data['college_degree_pct'] * 100).round(1)
-        
-        # Round numeric columns
-        export_data['median_age'] = export_data['median_age'].round(1)
-        export_data['median_income'] = export_data['median_income'].round(0)
-        
-        # Convert to records format
-        records = export_data.to_dict('records')
-        
-        return jsonify({
-            "success": True,
-            "data": records,
-            "total_records": len(records),
-            "message": f"Successfully exported {len(records)} zip codes"
-        })
-        
+        export_format = data.get('format') or request.args.get('format', 'json')
+        compression = data.get('compression') or request.args.get('compression')
+        requested_columns = data.get('columns') or request.args.get('columns')
+        if isinstance(requested_columns, str):
+            requested_columns = [col.strip() for col in requested_columns.split(',') if col.strip()]
+        
+        if export_format != 'json' and export_format not in EXPORT_FORMATS:
+            return jsonify({"error": f"Format must be one of: json, {', '.join(EXPORT_FORMATS)}"}), 400
+        
+        if compression and (compression not in EXPORT_COMPRESSIONS or export_format == 'json'
+                            or (export_format == 'arrow' and compression != 'zstd')):
+            return jsonify({"error": f"Unsupported compression '{compression}' for {export_format} export"}), 400
+        
+        engine = get_target_engine()
+        df = engine['source']
+        columns = export_columns(df, requested_columns)
+        positions = filter_positions(engine, filters)
+        
+        if export_format == 'json':
+            records = format_export_chunk(df, positions, columns).to_dict('records')
+            
+            return jsonify({
+                "success": True,
+                "data": records,
+                "total_records": len(records),
+                "message": f"Successfully exported {len(records)} zip codes"
+            })
+        
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        if compression and export_format == 'csv':
+            mimetype, suffix = EXPORT_COMPRESSIONS[compression]
+            extension = f"{extension}.{suffix}"
+        
+        response = app.response_class(stream_with_context(
+            stream_export(df, positions, columns, export_format, compression)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="zip_export.{extension}"'
+        response.headers['X-Total-Records'] = str(len(positions))
+        return response
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Export failed: {str(e)}"}), 500
 
+def select_map_zip_codes(filters):
+    """Column arrays of the map's top zip codes plus the market summary.
+    Returns (selection, status_code)."""
+    engine = get_target_engine()
+    
+    # Target population ranking for the filters, served from the materialized
+    # rankings when the combination was precomputed
+    ranking = get_target_ranking(engine, filters, top_k=1000)
+    total_target_population = ranking['total']
+    
+    print(f"Total target population after filters: {total_target_population:,.0f}")
+    print(f"Zip codes with target population > 0: {ranking['matching_count']}")
+    
+    if total_target_population == 0:
+        return {"error": "No zip codes match the selected demographic criteria"}, 400
+    
+    # Calculate 50% and 80% thresholds for metrics
+    fifty_percent_threshold = total_target_population * 0.5
+    eighty_percent_threshold = total_target_population * 0.8
+    
+    # Zip codes needed for 50% and 80% of target population
+    top_50_percent_count = ranking['top_50_percent_count']
+    top_80_percent_count = ranking['top_80_percent_count']
+    
+    # SIMPLIFIED: For map, just take top 1000 zip codes by target population
+    top_1000_count = len(ranking['positions'])
+    
+    print(f"Total target population: {total_target_population:,.0f}")
+    print(f"50% threshold: {fifty_percent_threshold:,.0f} - requires {top_50_percent_count} zip codes")
+    print(f"80% threshold: {eighty_percent_threshold:,.0f} - requires {top_80_percent_count} zip codes")
+    print(f"Top 1000 zip codes: {top_1000_count} zip codes (out of {ranking['matching_count']} total matching)")
+    
+    # Prepare zip codes for map (only top 1000 by target population), column by
+    # column, gathering just those rows of the dataset the ranking was built on
+    df = engine['source']
+    positions = ranking['positions']
+    if 'latitude' in df.columns and 'longitude' in df.columns:
+        latitudes = df['latitude'].iloc[positions].to_numpy(dtype=np.float64)
+        longitudes = df['longitude'].iloc[positions].to_numpy(dtype=np.float64)
+    else:
+        print("Missing coordinate columns in demographic data")
+        latitudes = longitudes = np.full(len(positions), np.nan)
+    
+    # Only include zip codes with valid coordinates
+    has_coordinates = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    positions = positions[has_coordinates]
+    
+    zip_codes = np.array(take_text_column(df, 'zip_code', positions), dtype=str)
+    states = np.array(take_text_column(df, 'state', positions), dtype=str)
+    target_population = np.trunc(ranking['target_population'][has_coordinates]).astype(np.int64)
+    
+    columns = {
+        'zipCode': zip_codes,
+        'latitude': latitudes[has_coordinates],
+        'longitude': longitudes[has_coordinates],
+        'population': target_population,
+        'state': states,
+    }
+    
+    summary = {
+        "totalZipCodes": len(positions),
+        "totalPopulation": int(total_target_population),
+        "fiftyPercentPopulation": int(fifty_percent_threshold),
+        "top50PercentZipCount": top_50_percent_count,
+        "top80PercentZipCount": top_80_percent_count,
+        "top1000ZipCount": top_1000_count,  # For map display
+        "totalMatchingZipCodes": ranking['matching_count'],  # Total zip codes that match criteria
+        "filters": filters
+    }
+    
+    return {"columns": columns, "summary": summary}, 200
+
+def pack_map_zip_codes(columns, summary):
+    """Pack map zip codes into little-endian binary buffers.
+
+    Layout: b'RZB1' | uint32 metadata length | metadata JSON (space-padded to
+    4 bytes) | float32 latitude[n] | float32 longitude[n] | int32 population[n] |
+    uint16 state index[n] (zero-padded to 4 bytes) | zip codes as ASCII,
+    ``zipCodeWidth`` bytes each (NUL-padded). The metadata carries the summary
+    fields, ``count``, ``zipCodeWidth`` and the ``states`` lookup table.
+    """
+    count = len(columns['zipCode'])
+    states, state_index = np.unique(columns['state'], return_inverse=True)
+    zip_codes = columns['zipCode'].astype('S')
+    zip_code_width = max(zip_codes.dtype.itemsize, 1)
+
+    metadata = app.json.dumps_bytes(dict(
+        summary, count=count, states=states.tolist(), zipCodeWidth=zip_code_width
+    ))
+    metadata += b' ' * (-len(metadata) % 4)
+    state_bytes = state_index.astype('<u2').tobytes()
+    state_bytes += b'\0' * (-len(state_bytes) % 4)
+
+    return b''.join([
+        b'RZB1',
+        struct.pack('<I', len(metadata)),
+        metadata,
+        columns['latitude'].astype('<f4').tobytes(),
+        columns['longitude'].astype('<f4').tobytes(),
+        columns['population'].astype('<i4').tobytes(),
+        state_bytes,
+        zip_codes.astype(f'S{zip_code_width}').tobytes(),
+    ])
+
+def build_zip_codes_map_response(filters, response_format='rows'):
+    """Build the /api/zip-codes payload in the requested format
+    ('rows', 'columnar' or 'binary'). Returns (payload, status_code)."""
+    selection, status_code = select_map_zip_codes(filters)
+    if status_code != 200:
+        return selection, status_code
+    
+    columns = selection['columns']
+    summary = selection['summary']
+    
+    if response_format == 'columnar':
+        # Parallel arrays; numeric columns are encoded straight from NumPy
+        return dict(summary, format='columnar', columns=columns), 200
+    
+    if response_format == 'binary':
+        return pack_map_zip_codes(columns, summary), 200
+    
+    zip_codes_for_map = [
+        {'zipCode': zip_code, 'latitude': latitude, 'longitude': longitude,
+         'population': population, 'state': state}
+        for zip_code, latitude, longitude, population, state in zip(
+            columns['zipCode'].tolist(), columns['latitude'].tolist(),
+            columns['longitude'].tolist(), columns['population'].tolist(),
+            columns['state'].tolist()
+        )
+    ]
+    
+    return dict(summary, zipCodes=zip_codes_for_map), 200
+
+def negotiate_map_format():
+    """Response format for /api/zip-codes from ?format= or the Accept header"""
+    requested = request.args.get('format')
+    if requested:
+        return requested if requested in MAP_RESPONSE_FORMATS else None
+
+    best = request.accept_mimetypes.best_match(list(MAP_RESPONSE_FORMATS.values()),
+                                               default=MAP_RESPONSE_FORMATS['rows'])
+    return next(name for name, mimetype in MAP_RESPONSE_FORMATS.items() if mimetype == best)
+
+def build_zip_codes_lod_response(filters, zoom, bbox):
+    """Level-of-detail map payload for one viewport.
+
+    Matching zip codes in ``bbox`` are sent individually when there are at most
+    LOD_MAX_POINTS of them; otherwise they are aggregated into the precomputed
+    grid cells for ``zoom``, each with its zip count, target population,
+    population-weighted centroid and bounds to zoom into. Payload size is
+    bounded by the cells visible in the viewport. Returns (payload, status_code).
+    """
+    engine = get_target_engine()
+    spatial_index = engine['spatial_index']
+    if spatial_index is None:
+        return {"error": "Zip coordinates not available"}, 500
+    
+    target_population = compute_target_population(engine, filters)
+    rows = rows_in_bbox(spatial_index, bbox['south'], bbox['west'], bbox['north'], bbox['east'])
+    rows = rows[target_population[rows] > 0]
+    
+    summary = {
+        "zoom": zoom,
+        "bbox": bbox,
+        "filters": filters,
+        "totalZipCodes": len(rows),
+        "totalPopulation": int(target_population[rows].sum()),
+    }
+    
+    if len(rows) <= LOD_MAX_POINTS:
+        ranked = rows[top_k_positions(target_population[rows], len(rows))]
+        return {**summary, "mode": "zipCodes", "zipCodes": spatial_zip_rows(engine, ranked, target_population)}, 200
+    
+    cell_ids, inverse = np.unique(spatial_index['cells'][min(zoom, LOD_MAX_ZOOM)][rows], return_inverse=True)
+    weights = target_population[rows]
+    population = np.bincount(inverse, weights=weights)
+    zip_counts = np.bincount(inverse)
+    latitudes = np.bincount(inverse, weights=weights * spatial_index['latitude'][rows]) / population
+    longitudes = np.bincount(inverse, weights=weights * spatial_index['longitude'][rows]) / population
+    bounds = lod_cell_bounds(cell_ids, min(zoom, LOD_MAX_ZOOM))
+    
+    order = np.argsort(-population, kind='stable')
+    clusters = [
+        {
+            "latitude": latitude,
+            "longitude": longitude,
+            "zipCount": zip_count,
+            "population": int(cluster_population),
+            "bounds": {"south": south, "west": west, "north": north, "east": east}
+        }
+        for latitude, longitude, zip_count, cluster_population, south, west, north, east in zip(
+            latitudes[order].tolist(), longitudes[order].tolist(), zip_counts[order].tolist(),
+            population[order].tolist(), bounds['south'][order].tolist(), bounds['west'][order].tolist(),
+            bounds['north'][order].tolist(), bounds['east'][order].tolist())
+    ]
+    
+    return {**summary, "mode": "clusters", "clusters": clusters}, 200
+
+def build_map_tile(filters, z, x, y):
+    """Render one map tile of matching zip codes as a compact binary payload.
+
+    Tiles with at most TILE_MAX_POINTS matching zip codes hold every zip;
+    denser tiles are aggregated into the LOD grid TILE_CLUSTER_ZOOM_OFFSET
+    zooms below the tile, placed at each cell's population-weighted centroid.
+
+    Layout: b'RZT1' | uint32 metadata length | metadata JSON (space-padded to
+    4 bytes) | uint16 x[n] | uint16 y[n] (tile-local, 0..TILE_EXTENT) |
+    int32 population[n] | int32 zip count[n] | zip codes as ASCII,
+    ``zipCodeWidth`` bytes each (points mode only). The metadata carries
+    ``z``, ``x``, ``y``, ``extent``, ``mode``, ``count`` and ``zipCodeWidth``.
+    Returns (payload, status_code).
+    """
+    engine = get_target_engine()
+    spatial_index = engine['spatial_index']
+    if spatial_index is None:
+        return {"error": "Zip coordinates not available"}, 500
+    
+    # Zip codes whose Web Mercator position falls inside this tile
+    tiles = 2 ** z
+    mercator_x, mercator_y = spatial_index['mercator']
+    west, east = x / tiles * 360 - 180, (x + 1) / tiles * 360 - 180
+    north = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / tiles))))
+    south = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / tiles))))
+    rows = rows_in_bbox(spatial_index, south, west, north, east)
+    rows = rows[(np.floor(mercator_x[rows] * tiles) == x) & (np.floor(mercator_y[rows] * tiles) == y)]
+    
+    target_population = compute_target_population(engine, filters)
+    rows = rows[target_population[rows] > 0]
+    
+    if len(rows) <= TILE_MAX_POINTS:
+        mode = 'points'
+        rows = rows[top_k_positions(target_population[rows], len(rows))]
+        tile_x, tile_y = mercator_x[rows], mercator_y[rows]
+        population = target_population[rows]
+        zip_counts = np.ones(len(rows), dtype=np.int64)
+        zip_codes = np.array(take_text_column(engine['source'], 'zip_code', rows), dtype='S')
+    else:
+        mode = 'clusters'
+        cell_zoom = min(z + TILE_CLUSTER_ZOOM_OFFSET, LOD_MAX_ZOOM)
+        _, inverse = np.unique(spatial_index['cells'][cell_zoom][rows], return_inverse=True)
+        weights = target_population[rows]
+        population = np.bincount(inverse, weights=weights)
+        zip_counts = np.bincount(inverse)
+        tile_x = np.bincount(inverse, weights=weights * mercator_x[rows]) / population
+        tile_y = np.bincount(inverse, weights=weights * mercator_y[rows]) / population
+        zip_codes = np.array([], dtype='S1')
+    
+    count = len(population)
+    zip_code_width = max(zip_codes.dtype.itemsize, 1)
+    local_x = np.clip(np.round((tile_x * tiles - x) * TILE_EXTENT), 0, TILE_EXTENT)
+    local_y = np.clip(np.round((tile_y * tiles - y) * TILE_EXTENT), 0, TILE_EXTENT)
+    
+    metadata = app.json.dumps_bytes({
+        "z": z, "x": x, "y": y, "extent": TILE_EXTENT, "mode": mode,
+        "count": count, "zipCodeWidth": zip_code_width,
+    })
+    metadata += b' ' * (-len(metadata) % 4)
+    
+    return b''.join([
+        b'RZT1',
+        struct.pack('<I', len(metadata)),
+        metadata,
+        local_x.astype('<u2').tobytes(),
+        local_y.astype('<u2').tobytes(),
+        np.trunc(population).astype('<i4').tobytes(),
+        zip_counts.astype('<i4').tobytes(),
+        zip_codes.astype(f'S{zip_code_width}').tobytes(),
+    ]), 200
+
+@app.route('/api/tiles/<int:z>/<int:x>/<int:y>')
+def get_map_tile(z, x, y):
+    """
+    Binary tile (see ``build_map_tile``) of zip code target population.
+    
+    Filters come from ?age=, ?ethnicity=, ?income=, ?gender= and ?education=
+    (comma-separated for a multi-select). Tiles are kept
+    in ``tile_cache`` and carry an ETag, so panning over tiles already seen is
+    a cache hit or a 304.
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({"error": "Tile out of range"}), 400
+    
+    try:
+        filters = target_filters_from_args()
+        return cached_response(
+            'tile', {'filters': filters, 'z': z, 'x': x, 'y': y},
+            lambda: build_map_tile(filters, z, x, y),
+            mimetype='application/octet-stream', cache=tile_cache
+        )
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error rendering tile {z}/{x}/{y}: {e}")
+        return jsonify({"error": f"Failed to render tile: {str(e)}"}), 500
+
+def build_zip_codes_table_response(filters, yearly_consumption):
+    """Build the /api/zip-codes-table payload. Returns (payload, status_code)."""
+    engine = get_target_engine()
+    
+    # Top 100 zip codes by target population for the filters
+    ranking = get_target_ranking(engine, filters, top_k=100)
+    total_target_population = ranking['total']
+    
+    if total_target_population == 0:
+        return {"error": "No zip codes match the selected demographic criteria"}, 400
+    
+    # Prepare table data column by column
+    positions = ranking['positions']
+    target_population = ranking['target_population']
+    population = engine['population'][positions]
+    
+    # Audience concentration (target audience / total population of that zip code)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        audience_concentration = np.where(population > 0, target_population / population * 100, 0.0)
+    
+    # Market potential
+    market_potential = np.trunc(target_population * yearly_consumption).astype(np.int64)
+    
+    # Only the ranked rows of the dataset the ranking was built on are gathered
+    df = engine['source']
+    zip_codes = take_text_column(df, 'zip_code', positions)
+    cities = take_text_column(df, 'city', positions)
+    states = take_text_column(df, 'state', positions)
+    
+    table_data = [
+        {'zipCode': zip_code, 'city': city, 'state': state,
+         'totalPopulation': total, 'targetAudience': target,
+         'audienceConcentration': round(concentration, 2), 'marketPotential': potential}
+        for zip_code, city, state, total, target, concentration, potential in zip(
+            zip_codes, cities, states,
+            np.trunc(population).astype(np.int64).tolist(),
+            np.trunc(target_population).astype(np.int64).tolist(),
+            audience_concentration.tolist(), market_potential.tolist()
+        )
+    ]
+    
+    response = {
+        "tableData": table_data,
+        "totalZipCodes": len(table_data),
+        "totalPopulation": int(total_target_population),
+        "totalMarketPotential": int(total_target_population * yearly_consumption),
+        "filters": filters,
+        "yearlyConsumption": yearly_consumption
+    }
+    
+    return response, 200
+
 @app.route('/api/zip-codes', methods=['POST'])
 def get_zip_codes_for_map():
     """
     Get zip codes with coordinates for the map visualization
     based on demographic filters.
     """
-    global demographic_df, zip_coordinates_df
-    
     try:
         # Load data if not already loaded
-        if demographic_df is None:
-            demographic_df = load_demographic_data()
-        
-        if zip_coordinates_df is None:
-            zip_coordinates_df = load_zip_coordinates()
-        
-        if demographic_df is None:
+        if not data_store.ensure_loaded():
             return jsonify({"error": "Demographic data not available"}), 500
         
         data = request.get_json()
         filters = data.get('filters', {})
         
-        print(f"Received filters: {filters}")
-        
-        # Start with all data
-        all_zip_codes = demographic_df.copy()
-        
-        # Calculate target population for each zip code based on demographic criteria
-        zip_codes_with_target_pop = all_zip_codes.copy()
-        zip_codes_with_target_pop['target_population'] = zip_codes_with_target_pop['population']
-        
-        # Apply age filter multiplier
-        if 'age' in filters and filters['age'] and filters['age'] != 'all':
-            age_multiplier = 0
-            if filters['age'] == 'under20':
-                if 'age_under_10' in zip_codes_with_target_pop.columns and 'age_10_to_19' in zip_codes_with_target_pop.columns:
-                    age_multiplier = (zip_codes_with_target_pop['age_under_10'] + zip_codes_with_target_pop['age_10_to_19']) / 100
-            elif filters['age'] == '20-29':
-                if 'age_20s' in zip_codes_with_target_pop.columns:
-                    age_multiplier = zip_codes_with_target_pop['age_20s'] / 100
-            elif filters['age'] == '30-39':
-                if 'age_30s' in zip_codes_with_target_pop.columns:
-                    age_multiplier = zip_codes_with_target_pop['age_30s'] / 100
-            elif filters['age'] == '40-49':
-                if 'age_40s' in zip_codes_with_target_pop.columns:
-                    age_multiplier = zip_codes_with_target_pop['age_40s'] / 100
-            elif filters['age'] == '50-59':
-                if 'age_50s' in zip_codes_with_target_pop.columns:
-                    age_multiplier = zip_codes_with_target_pop['age_50s'] / 100
-            elif filters['age'] == '60plus':
-                age_multiplier = 0
-                if 'age_60s' in zip_codes_with_target_pop.columns:
-                    age_multiplier += zip_codes_with_target_pop['age_60s']
-                if 'age_70s' in zip_codes_with_target_pop.columns:
-                    age_multiplier += zip_codes_with_target_pop['age_70s']
-                if 'age_over_80' in zip_codes_with_target_pop.columns:
-                    age_multiplier += zip_codes_with_target_pop['age_over_80']
-                age_multiplier = age_multiplier / 100
-            
-            zip_codes_with_target_pop['target_population'] *= age_multiplier
-        
-        # Apply ethnicity filter multiplier
-        if 'ethnicity' in filters and filters['ethnicity'] and filters['ethnicity'] != 'all':
-            ethnicity_multiplier = 0
-            if filters['ethnicity'] == 'white' and 'race_white' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_white'] / 100
-            elif filters['ethnicity'] == 'black' and 'race_black' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_black'] / 100
-            elif filters['ethnicity'] == 'hispanic' and 'hispanic' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['hispanic'] / 100
-            elif filters['ethnicity'] == 'native' and 'race_native' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_native'] / 100
-            elif filters['ethnicity'] == 'asian' and 'race_asian' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_asian'] / 100
-            elif filters['ethnicity'] == 'pacific' and 'race_pacific' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_pacific'] / 100
-            
-            zip_codes_with_target_pop['target_population'] *= ethnicity_multiplier
-        
-        # Apply income filter multiplier
-        if 'income' in filters and filters['income'] and filters['income'] != 'all':
-            income_multiplier = 0
-            if filters['income'] == 'under50k':
-                under_50k_cols = ['income_household_under_10k', 'income_household_10k_to_15k', 
-                                 'income_household_15k_to_20k', 'income_household_20k_to_25k', 
-                                 'income_household_25k_to_30k', 'income_household_30k_to_35k', 
-                                 'income_household_35k_to_40k', 'income_household_40k_to_45k', 
-                                 'income_household_45k_to_50k']
-                existing_cols = [col for col in under_50k_cols if col in zip_codes_with_target_pop.columns]
-                for col in existing_cols:
-                    income_multiplier += zip_codes_with_target_pop[col]
-                income_multiplier = income_multiplier / 100
-                    
-            elif filters['income'] == '50k-75k':
-                if 'income_household_50k_to_60k' in zip_codes_with_target_pop.columns:
-                    income_multiplier += zip_codes_with_target_pop['income_household_50k_to_60k']
-                if 'income_household_60k_to_75k' in zip_codes_with_target_pop.columns:
-                    income_multiplier += zip_codes_with_target_pop['income_household_60k_to_75k']
-                income_multiplier = income_multiplier / 100
-                    
-            elif filters['income'] == '75k-100k' and 'income_household_75k_to_100k' in zip_codes_with_target_pop.columns:
-                income_multiplier = zip_codes_with_target_pop['income_household_75k_to_100k'] / 100
-            elif filters['income'] == '100k-150k':
-                if 'income_household_100k_to_125k' in zip_codes_with_target_pop.columns:
-                    income_multiplier += zip_codes_with_target_pop['income_household_100k_to_125k']
-                if 'income_household_125k_to_150k' in zip_codes_with_target_pop.columns:
-                    income_multiplier += zip_codes_with_target_pop['income_household_125k_to_150k']
-                income_multiplier = income_multiplier / 100
-                    
-            elif filters['income'] == '150k-200k' and 'income_household_150k_to_200k' in zip_codes_with_target_pop.columns:
-                income_multiplier = zip_codes_with_target_pop['income_household_150k_to_200k'] / 100
-            elif filters['income'] == 'over200k' and 'income_household_over_200k' in zip_codes_with_target_pop.columns:
-                income_multiplier = zip_codes_with_target_pop['income_household_over_200k'] / 100
-            
-            zip_codes_with_target_pop['target_population'] *= income_multiplier
-        
-        # Apply gender filter multiplier
-        if 'gender' in filters and filters['gender'] and filters['gender'] != 'both':
-            print(f"Applying gender filter: {filters['gender']}")
-            gender_multiplier = 0
-            if filters['gender'] == 'male' and 'male' in zip_codes_with_target_pop.columns:
-                gender_multiplier = zip_codes_with_target_pop['male'] / 100
-                print(f"Male multiplier applied, range: {gender_multiplier.min():.3f} to {gender_multiplier.max():.3f}")
-            elif filters['gender'] == 'female' and 'female' in zip_codes_with_target_pop.columns:
-                gender_multiplier = zip_codes_with_target_pop['female'] / 100
-                print(f"Female multiplier applied, range: {gender_multiplier.min():.3f} to {gender_multiplier.max():.3f}")
-            
-            zip_codes_with_target_pop['target_population'] *= gender_multiplier
-            print(f"Target population after gender filter: {zip_codes_with_target_pop['target_population'].sum():,.0f}")
-        
-        # CRITICAL FIX: Filter out zip codes with zero or near-zero target population
-        zip_codes_with_target_pop = zip_codes_with_target_pop[zip_codes_with_target_pop['target_population'] > 0]
-        
-        # Calculate total target population across all matching zip codes
-        total_target_population = zip_codes_with_target_pop['target_population'].sum()
-        
-        print(f"Total target population after filters: {total_target_population:,.0f}")
-        print(f"Zip codes with target population > 0: {len(zip_codes_with_target_pop)}")
-        
-        if total_target_population == 0:
-            return jsonify({"error": "No zip codes match the selected demographic criteria"}), 400
-        
-        # Sort by target population (largest to smallest)
-        sorted_df = zip_codes_with_target_pop.sort_values('target_population', ascending=False)
-        
-        # Calculate cumulative population for metrics
-        cumulative_target_population = sorted_df['target_population'].cumsum()
-        
-        # Calculate 50% and 80% thresholds for metrics
-        fifty_percent_threshold = total_target_population * 0.5
-        eighty_percent_threshold = total_target_population * 0.8
-        
-        # Find zip codes needed for 50% and 80% of target population
-        top_50_percent = sorted_df[cumulative_target_population <= fifty_percent_threshold]
-        top_80_percent = sorted_df[cumulative_target_population <= eighty_percent_threshold]
-        
-        # SIMPLIFIED: For map, just take top 1000 zip codes by target population
-        top_1000 = sorted_df.head(1000)
-        
-        print(f"Total target population: {total_target_population:,.0f}")
-        print(f"50% threshold: {fifty_percent_threshold:,.0f} - requires {len(top_50_percent)} zip codes")
-        print(f"80% threshold: {eighty_percent_threshold:,.0f} - requires {len(top_80_percent)} zip codes")
-        print(f"Top 1000 zip codes: {len(top_1000)} zip codes (out of {len(sorted_df)} total matching)")
-        
-        # Prepare zip codes for map (only top 1000 by target population)
-        zip_codes_for_map = []
-        for _, row in top_1000.iterrows():
-            # Check if coordinates exist
-            if 'latitude' not in row or 'longitude' not in row:
-                print(f"Missing coordinates for zip {row.get('zip_code', 'unknown')}")
-                continue
-                
-            zip_info = {
-                'zipCode': str(row['zip_code']),
-                'latitude': float(row['latitude']) if pd.notna(row['latitude']) else None,
-                'longitude': float(row['longitude']) if pd.notna(row['longitude']) else None,
-                'population': int(row['target_population']),
-                'state': str(row.get('state', 'Unknown')) if 'state' in row else 'Unknown'
+        response_format = negotiate_map_format()
+        if response_format is None:
+            return jsonify({"error": f"Unsupported format. Use one of: {', '.join(MAP_RESPONSE_FORMATS)}"}), 400
+        
+        print(f"Received filters: {filters} (format: {response_format})")
+        
+        # Level-of-detail mode for a zoom level and viewport (always JSON)
+        if data.get('zoom') is not None and data.get('bbox') is not None:
+            zoom = int(request_float(data, 'zoom', 0, 30))
+            bbox = data['bbox'] if isinstance(data['bbox'], dict) else {}
+            bbox = {
+                'south': request_float(bbox, 'south', -90, 90),
+                'west': request_float(bbox, 'west', -180, 180),
+                'north': request_float(bbox, 'north', -90, 90),
+                'east': request_float(bbox, 'east', -180, 180),
             }
-            
-            # Only include zip codes with valid coordinates
-            if zip_info['latitude'] is not None and zip_info['longitude'] is not None:
-                zip_codes_for_map.append(zip_info)
-        
-        response = {
-            "zipCodes": zip_codes_for_map,
-            "totalZipCodes": len(zip_codes_for_map),
-            "totalPopulation": int(total_target_population),
-            "fiftyPercentPopulation": int(fifty_percent_threshold),
-            "top50PercentZipCount": len(top_50_percent),
-            "top80PercentZipCount": len(top_80_percent),
-            "top1000ZipCount": len(top_1000),  # For map display
-            "totalMatchingZipCodes": len(sorted_df),  # Total zip codes that match criteria
-            "filters": filters
-        }
+            return cached_response(
+                'zip-codes-lod', {'filters': filters, 'zoom': zoom, 'bbox': bbox},
+                lambda: build_zip_codes_lod_response(filters, zoom, bbox)
+            )
         
-        return jsonify(response)
+        return cached_response(
+            'zip-codes', {'filters': filters, 'format': response_format},
+            lambda: build_zip_codes_map_response(filters, response_format),
+            mimetype=MAP_RESPONSE_FORMATS[response_format]
+        )
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error in get_zip_codes_for_map: {str(e)}")
         import traceback
@@ -851,14 +3704,9 @@ def get_zip_codes_table():
     Get zip codes data for the table view with all required columns:
     ZIP Code, City, State, Total population, Target Audience, % of Total population, Market Potential
     """
-    global demographic_df
-    
     try:
         # Load data if not already loaded
-        if demographic_df is None:
-            demographic_df = load_demographic_data()
-        
-        if demographic_df is None:
+        if not data_store.ensure_loaded():
             return jsonify({"error": "Demographic data not available"}), 500
         
         data = request.get_json()
@@ -868,157 +3716,205 @@ def get_zip_codes_table():
         print(f"Received filters for table: {filters}")
         print(f"Yearly consumption: ${yearly_consumption}")
         
-        # Start with all data
-        all_zip_codes = demographic_df.copy()
-        
-        # Calculate target population for each zip code based on demographic criteria
-        zip_codes_with_target_pop = all_zip_codes.copy()
-        zip_codes_with_target_pop['target_population'] = zip_codes_with_target_pop['population']
-        
-        # Apply age filter multiplier
-        if 'age' in filters and filters['age'] and filters['age'] != 'all':
-            age_multiplier = 0
-            if filters['age'] == 'under20':
-                if 'age_under_10' in zip_codes_with_target_pop.columns and 'age_10_to_19' in zip_codes_with_target_pop.columns:
-                    age_multiplier = (zip_codes_with_target_pop['age_under_10'] + zip_codes_with_target_pop['age_10_to_19']) / 100
-            elif filters['age'] == '20-29':
-                if 'age_20s' in zip_codes_with_target_pop.columns:
-                    age_multiplier = zip_codes_with_target_pop['age_20s'] / 100
-            elif filters['age'] == '30-39':
-                if 'age_30s' in zip_codes_with_target_pop.columns:
-                    age_multiplier = zip_codes_with_target_pop['age_30s'] / 100
-            elif filters['age'] == '40-49':
-                if 'age_40s' in zip_codes_with_target_pop.columns:
-                    age_multiplier = zip_codes_with_target_pop['age_40s'] / 100
-            elif filters['age'] == '50-59':
-                if 'age_50s' in zip_codes_with_target_pop.columns:
-                    age_multiplier = zip_codes_with_target_pop['age_50s'] / 100
-            elif filters['age'] == '60plus':
-                age_multiplier = 0
-                if 'age_60s' in zip_codes_with_target_pop.columns:
-                    age_multiplier += zip_codes_with_target_pop['age_60s']
-                if 'age_70s' in zip_codes_with_target_pop.columns:
-                    age_multiplier += zip_codes_with_target_pop['age_70s']
-                if 'age_over_80' in zip_codes_with_target_pop.columns:
-                    age_multiplier += zip_codes_with_target_pop['age_over_80']
-                age_multiplier = age_multiplier / 100
-            
-            zip_codes_with_target_pop['target_population'] *= age_multiplier
-        
-        # Apply ethnicity filter multiplier
-        if 'ethnicity' in filters and filters['ethnicity'] and filters['ethnicity'] != 'all':
-            ethnicity_multiplier = 0
-            if filters['ethnicity'] == 'white' and 'race_white' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_white'] / 100
-            elif filters['ethnicity'] == 'black' and 'race_black' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_black'] / 100
-            elif filters['ethnicity'] == 'hispanic' and 'hispanic' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['hispanic'] / 100
-            elif filters['ethnicity'] == 'native' and 'race_native' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_native'] / 100
-            elif filters['ethnicity'] == 'asian' and 'race_asian' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_asian'] / 100
-            elif filters['ethnicity'] == 'pacific' and 'race_pacific' in zip_codes_with_target_pop.columns:
-                ethnicity_multiplier = zip_codes_with_target_pop['race_pacific'] / 100
-            
-            zip_codes_with_target_pop['target_population'] *= ethnicity_multiplier
-        
-        # Apply income filter multiplier
-        if 'income' in filters and filters['income'] and filters['income'] != 'all':
-            income_multiplier = 0
-            if filters['income'] == 'under50k':
-                under_50k_cols = ['income_household_under_10k', 'income_household_10k_to_15k', 
-                                 'income_household_15k_to_20k', 'income_household_20k_to_25k', 
-                                 'income_household_25k_to_30k', 'income_household_30k_to_35k', 
-                                 'income_household_35k_to_40k', 'income_household_40k_to_45k', 
-                                 'income_household_45k_to_50k']
-                existing_cols = [col for col in under_50k_cols if col in zip_codes_with_target_pop.columns]
-                for col in existing_cols:
-                    income_multiplier += zip_codes_with_target_pop[col]
-                income_multiplier = income_multiplier / 100
-                    
-            elif filters['income'] == '50k-75k':
-                if 'income_household_50k_to_60k' in zip_codes_with_target_pop.columns:
-                    income_multiplier += zip_codes_with_target_pop['income_household_50k_to_60k']
-                if 'income_household_60k_to_75k' in zip_codes_with_target_pop.columns:
-                    income_multiplier += zip_codes_with_target_pop['income_household_60k_to_75k']
-                income_multiplier = income_multiplier / 100
-                    
-            elif filters['income'] == '75k-100k' and 'income_household_75k_to_100k' in zip_codes_with_target_pop.columns:
-                income_multiplier = zip_codes_with_target_pop['income_household_75k_to_100k'] / 100
-            elif filters['income'] == '100k-150k':
-                if 'income_household_100k_to_125k' in zip_codes_with_target_pop.columns:
-                    income_multiplier += zip_codes_with_target_pop['income_household_100k_to_125k']
-                if 'income_household_125k_to_150k' in zip_codes_with_target_pop.columns:
-                    income_multiplier += zip_codes_with_target_pop['income_household_125k_to_150k']
-                income_multiplier = income_multiplier / 100
-                    
-            elif filters['income'] == '150k-200k' and 'income_household_150k_to_200k' in zip_codes_with_target_pop.columns:
-                income_multiplier = zip_codes_with_target_pop['income_household_150k_to_200k'] / 100
-            elif filters['income'] == 'over200k' and 'income_household_over_200k' in zip_codes_with_target_pop.columns:
-                income_multiplier = zip_codes_with_target_pop['income_household_over_200k'] / 100
-            
-            zip_codes_with_target_pop['target_population'] *= income_multiplier
-        
-        # Apply gender filter multiplier
-        if 'gender' in filters and filters['gender'] and filters['gender'] != 'both':
-            gender_multiplier = 0
-            if filters['gender'] == 'male' and 'male' in zip_codes_with_target_pop.columns:
-                gender_multiplier = zip_codes_with_target_pop['male'] / 100
-            elif filters['gender'] == 'female' and 'female' in zip_codes_with_target_pop.columns:
-                gender_multiplier = zip_codes_with_target_pop['female'] / 100
-            
-            zip_codes_with_target_pop['target_population'] *= gender_multiplier
+        return cached_response(
+            'zip-codes-table', {'filters': filters, 'yearly_consumption': yearly_consumption},
+            lambda: build_zip_codes_table_response(filters, yearly_consumption)
+        )
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in get_zip_codes_table: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Failed to get zip codes table: {str(e)}"}), 500
+
+def request_float(source, name, low, high, default=None):
+    """Float parameter ``name`` from ``source`` (query args or a JSON dict),
+    required unless ``default`` is given. Raises ValueError outside [low, high]."""
+    value = source.get(name, default)
+    if value is None:
+        raise ValueError(f"Missing parameter: {name}")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid number for {name}: {value}")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+def spatial_zip_rows(engine, rows, target_population, distances=None):
+    """Map-style zip rows for ``demographic_df`` positions ``rows``"""
+    df = engine['source']
+    spatial_index = engine['spatial_index']
+    columns = [
+        ('zipCode', take_text_column(df, 'zip_code', rows)),
+        ('latitude', spatial_index['latitude'][rows].tolist()),
+        ('longitude', spatial_index['longitude'][rows].tolist()),
+        ('population', target_population[rows].astype(np.int64).tolist()),
+        ('totalPopulation', engine['population'][rows].astype(np.int64).tolist()),
+        ('state', take_text_column(df, 'state', rows)),
+    ]
+    if distances is not None:
+        columns.append(('distanceMiles', np.round(distances, 2).tolist()))
+    
+    names = [name for name, _ in columns]
+    return [dict(zip(names, values)) for values in zip(*[values for _, values in columns])]
+
+@app.route('/api/spatial/radius')
+def get_zip_codes_in_radius():
+    """
+    Zip codes within ?miles= of ?lat=/?lng=, nearest first.
+    
+    Optional ?age=, ?ethnicity=, ?income= and ?gender= set the target
+    population and ?limit= caps the zip codes returned (default 1000).
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        latitude = request_float(request.args, 'lat', -90, 90)
+        longitude = request_float(request.args, 'lng', -180, 180)
+        miles = request_float(request.args, 'miles', 0, MAX_RADIUS_MILES)
+        limit = max(0, int(request.args.get('limit', 1000)))
+        filters = target_filters_from_args()
         
-        # Filter out zip codes with zero or near-zero target population
-        zip_codes_with_target_pop = zip_codes_with_target_pop[zip_codes_with_target_pop['target_population'] > 0]
+        engine = get_target_engine()
+        if engine['spatial_index'] is None:
+            return jsonify({"error": "Zip coordinates not available"}), 500
         
-        # Calculate total target population across all matching zip codes
-        total_target_population = zip_codes_with_target_pop['target_population'].sum()
+        rows, distances = rows_within_radius(engine['spatial_index'], latitude, longitude, miles)
+        target_population = compute_target_population(engine, filters)
+        
+        return jsonify({
+            "center": {"latitude": latitude, "longitude": longitude},
+            "miles": miles,
+            "filters": filters,
+            "totalZipCodes": len(rows),
+            "totalPopulation": int(engine['population'][rows].sum()),
+            "targetPopulation": int(target_population[rows].sum()),
+            "zipCodes": spatial_zip_rows(engine, rows[:limit], target_population, distances[:limit])
+        })
         
-        if total_target_population == 0:
-            return jsonify({"error": "No zip codes match the selected demographic criteria"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in radius query: {e}")
+        return jsonify({"error": f"Radius query failed: {str(e)}"}), 500
+
+@app.route('/api/spatial/bbox')
+def get_zip_codes_in_bbox():
+    """
+    Zip codes whose centroid lies in the ?south=&west=&north=&east= viewport,
+    ranked by target population.
+    
+    Takes the same target filters and ?limit= as /api/spatial/radius. A box
+    with west > east crosses the antimeridian.
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        south = request_float(request.args, 'south', -90, 90)
+        north = request_float(request.args, 'north', south, 90)
+        west = request_float(request.args, 'west', -180, 180)
+        east = request_float(request.args, 'east', -180, 180)
+        limit = max(0, int(request.args.get('limit', 1000)))
+        filters = target_filters_from_args()
         
-        # Sort by target population (largest to smallest) and take top 100
-        sorted_df = zip_codes_with_target_pop.sort_values('target_population', ascending=False)
-        top_100 = sorted_df.head(100)
+        engine = get_target_engine()
+        if engine['spatial_index'] is None:
+            return jsonify({"error": "Zip coordinates not available"}), 500
         
-        # Prepare table data
-        table_data = []
-        for _, row in top_100.iterrows():
-            # Calculate audience concentration (target audience / total population of that zip code)
-            audience_concentration = (row['target_population'] / row['population']) * 100 if row['population'] > 0 else 0
-            
-            # Calculate market potential
-            market_potential = row['target_population'] * yearly_consumption
-            
-            table_row = {
-                'zipCode': str(row['zip_code']),
-                'city': str(row.get('city', 'Unknown')) if 'city' in row and pd.notna(row.get('city')) else 'Unknown',
-                'state': str(row.get('state', 'Unknown')) if 'state' in row else 'Unknown',
-                'totalPopulation': int(row['population']),
-                'targetAudience': int(row['target_population']),
-                'audienceConcentration': round(audience_concentration, 2),
-                'marketPotential': int(market_potential)
-            }
-            table_data.append(table_row)
+        rows = rows_in_bbox(engine['spatial_index'], south, west, north, east)
+        target_population = compute_target_population(engine, filters)
+        ranked = rows[top_k_positions(target_population[rows], limit)]
         
-        response = {
-            "tableData": table_data,
-            "totalZipCodes": len(table_data),
-            "totalPopulation": int(total_target_population),
-            "totalMarketPotential": int(total_target_population * yearly_consumption),
+        return jsonify({
+            "bbox": {"south": south, "west": west, "north": north, "east": east},
             "filters": filters,
-            "yearlyConsumption": yearly_consumption
-        }
+            "totalZipCodes": len(rows),
+            "totalPopulation": int(engine['population'][rows].sum()),
+            "targetPopulation": int(target_population[rows].sum()),
+            "zipCodes": spatial_zip_rows(engine, ranked, target_population)
+        })
         
-        return jsonify(response)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in bbox query: {e}")
+        return jsonify({"error": f"Bounding box query failed: {str(e)}"}), 500
+
+@app.route('/api/spatial/store-radius', methods=['POST'])
+def analyze_store_radius():
+    """
+    Target population within a radius of each store.
+    
+    Body: ``{"stores": [{"id", "latitude", "longitude", "miles"?}], "miles",
+    "filters"}``. Radii are straight-line (great-circle) miles. Every store is
+    queried against the spatial index in one batch; the totals also give the
+    combined footprint with overlapping zip codes counted once.
+    """
+    if not data_store.ensure_loaded():
+        return jsonify({"error": "Demographic data not available"}), 500
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        stores = data.get('stores')
+        filters = data.get('filters', {})
+        
+        if not isinstance(stores, list) or not stores:
+            return jsonify({"error": "stores must be a non-empty list"}), 400
+        if len(stores) > MAX_STORES:
+            return jsonify({"error": f"At most {MAX_STORES} stores per request"}), 400
+        if not all(isinstance(store, dict) for store in stores):
+            return jsonify({"error": "Each store must be an object with latitude and longitude"}), 400
+        
+        default_miles = request_float(data, 'miles', 0, MAX_RADIUS_MILES, default=10)
+        latitudes = np.array([request_float(store, 'latitude', -90, 90) for store in stores])
+        longitudes = np.array([request_float(store, 'longitude', -180, 180) for store in stores])
+        radii = np.array([request_float(store, 'miles', 0, MAX_RADIUS_MILES, default=default_miles)
+                          for store in stores])
+        
+        engine = get_target_engine()
+        spatial_index = engine['spatial_index']
+        if spatial_index is None:
+            return jsonify({"error": "Zip coordinates not available"}), 500
+        
+        population = engine['population']
+        target_population = compute_target_population(engine, filters)
+        matches = spatial_index['tree'].query_ball_point(unit_vectors(latitudes, longitudes), chord_length(radii))
+        
+        results = []
+        for i, (store, match) in enumerate(zip(stores, matches)):
+            rows = spatial_index['rows'][match]
+            results.append({
+                "id": store.get('id', i),
+                "latitude": float(latitudes[i]),
+                "longitude": float(longitudes[i]),
+                "miles": float(radii[i]),
+                "zipCodeCount": len(rows),
+                "totalPopulation": int(population[rows].sum()),
+                "targetPopulation": int(target_population[rows].sum())
+            })
+        
+        footprint = np.unique(np.concatenate([spatial_index['rows'][match] for match in matches]))
         
+        return jsonify({
+            "filters": filters,
+            "stores": results,
+            "footprint": {
+                "zipCodeCount": len(footprint),
+                "totalPopulation": int(population[footprint].sum()),
+                "targetPopulation": int(target_population[footprint].sum())
+            }
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error in get_zip_codes_table: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Failed to get zip codes table: {str(e)}"}), 500
+        print(f"Error in store radius analysis: {e}")
+        return jsonify({"error": f"Store radius analysis failed: {str(e)}"}), 500
 
 def validate_filters(filters):
     """Validate demographic filters"""
@@ -1049,7 +3945,10 @@ def debug_data_status():
         "demographic_data_shape": demographic_df.shape if demographic_df is not None else None,
         "zip_coordinates_shape": zip_coordinates_df.shape if zip_coordinates_df is not None else None,
         "demographic_columns": list(demographic_df.columns) if demographic_df is not None else None,
-        "zip_coordinates_columns": list(zip_coordinates_df.columns) if zip_coordinates_df is not None else None
+        "zip_coordinates_columns": list(zip_coordinates_df.columns) if zip_coordinates_df is not None else None,
+        "load": data_store.status(),
+        "result_cache": result_cache.stats(),
+        "tile_cache": tile_cache.stats()
     }
     
     return jsonify(status)
@@ -1063,17 +3962,16 @@ def test_data_sample():
         return jsonify({"error": "No data loaded"}), 500
     
     # Return first 5 rows with key columns
-    sample_data = []
     key_columns = ['zip_code', 'population', 'latitude', 'longitude', 'state']
+    sample = demographic_df.head()
+    if 'zip_code' not in sample.columns and 'zip_key' in sample.columns:
+        sample = sample.assign(zip_code=zip_code_strings(sample['zip_key']))
     
-    for idx, row in demographic_df.head().iterrows():
-        sample_row = {}
-        for col in key_columns:
-            if col in row:
-                sample_row[col] = str(row[col])
-            else:
-                sample_row[col] = "MISSING"
-        sample_data.append(sample_row)
+    columns = [
+        sample[col].astype(str).tolist() if col in sample.columns else ["MISSING"] * len(sample)
+        for col in key_columns
+    ]
+    sample_data = [dict(zip(key_columns, values)) for values in zip(*columns)]
     
     return jsonify({
         "data_shape": demographic_df.shape,
@@ -1081,10 +3979,27 @@ def test_data_sample():
         "sample_data": sample_data
     })
 
-if __name__ == '__main__':
-    # Load demographic data on startup
+def load_application_data():
+    """Load the demographic data and everything derived from it.
+    
+    Returns (loaded, stage_seconds) where stage_seconds times each load stage.
+    Called through ``data_store`` so concurrent requests share one load.
+    """
+    global demographic_df, zip_coordinates_df
+    
+    stage_seconds = {}
+    
+    start = time.perf_counter()
     demographic_df = load_demographic_data()
+    stage_seconds['demographic_data'] = round(time.perf_counter() - start, 3)
+    
+    start = time.perf_counter()
     zip_coordinates_df = load_zip_coordinates()
+    stage_seconds['zip_coordinates'] = round(time.perf_counter() - start, 3)
+    
+    start = time.perf_counter()
+    get_target_engine()
+    stage_seconds['target_engine'] = round(time.perf_counter() - start, 3)
     
     if demographic_df is not None:
         print(f"Loaded {len(demographic_df)} zip codes with demographic data")
@@ -1096,8 +4011,15 @@ if __name__ == '__main__':
     else:
         print("Warning: Failed to load zip coordinates")
     
+    return demographic_df is not None, stage_seconds
+
+data_store = DemographicDataStore(load_application_data)
+
+if __name__ == '__main__':
+    # Load demographic data on startup
+    data_store.ensure_loaded()
+    
     # Run the Flask app
-    import os
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     app.run(debug=debug, host='0.0.0.0', port=port)
@@ -210,8 +210,8 @@ class USMarketMap {
   }
 
   async fetchZipCodeData(filters) {
-    // Use the new API endpoint we created
-    const apiUrl = '/api/zip-codes';
+    // Use the new API endpoint we created, in the packed binary format
+    const apiUrl = '/api/zip-codes?format=binary';
     
     try {
       const response = await fetch(apiUrl, {
@@ -226,7 +226,7 @@ class USMarketMap {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
+      const data = this.decodeBinaryZipCodes(await response.arrayBuffer());
       return data;
     } catch (error) {
       console.error('Error fetching zip code data:', error);
@@ -236,6 +236,46 @@ class USMarketMap {
     }
   }
 
+  decodeBinaryZipCodes(buffer) {
+    // Layout written by pack_map_zip_codes() in server.py
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'RZB1') {
+      throw new Error('Unexpected zip code payload');
+    }
+
+    const metadataLength = view.getUint32(4, true);
+    const textDecoder = new TextDecoder();
+    const metadata = JSON.parse(textDecoder.decode(new Uint8Array(buffer, 8, metadataLength)));
+    const count = metadata.count;
+    const width = metadata.zipCodeWidth;
+
+    // Column buffers are 4-byte aligned, so typed arrays view them without copying
+    let offset = 8 + metadataLength;
+    const latitudes = new Float32Array(buffer, offset, count);
+    offset += count * 4;
+    const longitudes = new Float32Array(buffer, offset, count);
+    offset += count * 4;
+    const populations = new Int32Array(buffer, offset, count);
+    offset += count * 4;
+    const stateIndex = new Uint16Array(buffer, offset, count);
+    offset += Math.ceil(count * 2 / 4) * 4;
+    const zipCodeText = textDecoder.decode(new Uint8Array(buffer, offset, count * width));
+
+    const zipCodes = new Array(count);
+    for (let i = 0; i < count; i++) {
+      zipCodes[i] = {
+        zipCode: zipCodeText.substr(i * width, width).replace(/\0+$/, ''),
+        latitude: latitudes[i],
+        longitude: longitudes[i],
+        population: populations[i],
+        state: metadata.states[stateIndex[i]]
+      };
+    }
+
+    return { ...metadata, zipCodes };
+  }
+
   async visualizeZipCodesProgressively(zipCodeData) {
     // Store zip code data for later use
     this.zipCodeData = zipCodeData;
@@ -1,27 +1,39 @@
-import pandas as pd
 import os
+import time
+
+import pandas as pd
+
+from server import EXCEL_DATASET_PATH, clean_demographic_data, ingest_demographic_excel
+
+EXCEL_PATH = EXCEL_DATASET_PATH
 
-def test_excel_loading():
-    """Test if we can read the Excel file"""
-    try:
-        excel_path = 'ACSData/WorkingFile_ZipDemographicData_ACS_2023.xlsx'
-        if not os.path.exists(excel_path):
-            print(f"Excel file not found at: {excel_path}")
-            return False
-            
-        print(f"Loading Excel file from: {excel_path}")
-        df = pd.read_excel(excel_path)
-        
-        print(f"Excel columns: {df.columns.tolist()}")
-        print(f"Excel shape: {df.shape}")
-        print(f"First few rows:")
-        print(df.head())
-        
-        return True
-        
-    except Exception as e:
-        print(f"Error loading Excel file: {e}")
+def time_ingest(label, ingest):
+    """Wall time of one Excel ingestion, plus its per-stage times when it reports them"""
+    start = time.perf_counter()
+    df, stage_seconds = ingest()
+    elapsed = time.perf_counter() - start
+
+    print(f"{label:<42} {elapsed * 1000:10.1f} ms  ({0 if df is None else len(df)} rows)")
+    for stage, seconds in stage_seconds.items():
+        print(f"  {stage:<40} {seconds * 1000:10.1f} ms")
+    return df
+
+def benchmark_excel_ingestion(workers=(0, 4)):
+    """Time the staged Excel ingestion pipeline against a single pd.read_excel
+    call plus cleaning, and check that every variant cleans to the same frame"""
+    if not os.path.exists(EXCEL_PATH):
+        print(f"Excel file not found at: {EXCEL_PATH}")
         return False
 
+    expected = time_ingest("pd.read_excel + cleaning",
+                           lambda: (clean_demographic_data(pd.read_excel(EXCEL_PATH)), {}))
+
+    for count in workers:
+        df = time_ingest(f"ingestion pipeline ({count or 'no'} workers)",
+                         lambda: ingest_demographic_excel(EXCEL_PATH, workers=count))
+        pd.testing.assert_frame_equal(expected, df)
+
+    return True
+
 if __name__ == "__main__":
-    test_excel_loading()
+    benchmark_excel_ingestion()